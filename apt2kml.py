@@ -3,13 +3,9 @@
 # Converts a TowerTrainer .apt file to a KML file
 # Output file will have same name, as kml file
 
-import re
-import sys
+import argparse
 from pathlib import Path
-import sectorfile
-import vrccolors
-import xml.etree.ElementTree as ET
-import xml.dom.minidom
+import kmlwriter
 
 class ttapt:
 
@@ -35,159 +31,43 @@ class ttapt:
         else:
             self.labelcolors[color] = [(coords, name)]
 
-    def htmlcolortokml(self, color):
-        # Get the color in KML format
-        if color in vrccolors.defaultcolors:
-            # Get HTML color, strip the #
-            color = vrccolors.defaultcolors[color].replace('#', '')
-        elif re.search(r'^\d{,8}$', color) is not None:
-            # If it's a plain VRC format, convert to HTML and strip the #
-            color = vrccolors.deccolortohtml(int(color)).replace('#', '')
-        else:
-            print("Missing color: "+color)
-        # Might want to handle a non-match, just in case
-        # Split into RGB pairs
-        colorsplit = [color[i:i+2] for i in range(0, len(color), 2)]
-        # Reverse because that's how KML does it
-        colorsplit.reverse()
-        # Join back together and return KML color
-        return ''.join(colorsplit)
-
-    def newsubfol(self, parent, name, open=0):
-        # Add subfolder to XML parent
-        newfol = ET.SubElement(parent, 'Folder')
-        fname = ET.SubElement(newfol, 'name')
-        fname.text = name
-        if open:  # Whether folder is expanded
-            openit = ET.SubElement(newfol, 'open')
-            openit.text = "1"
-        return newfol
-
-    def stylepair(self, key, surl):
-        # Create style pair for normal/highlighted
-        sroot = ET.Element('root')
-        pairit = ET.SubElement(sroot, 'Pair')
-        keyit = ET.SubElement(pairit, 'key')
-        keyit.text = key
-        surlit = ET.SubElement(pairit, 'styleUrl')
-        surlit.text = "#"+surl
-        return sroot
-
-    def style(self, styleid, scale, color):
-        # Create style definition for color
-        sroot = ET.Element('root')
-        styleit = ET.SubElement(sroot, 'Style', id=styleid)
-        isit = ET.SubElement(styleit, 'IconStyle')
-        scaleit = ET.SubElement(isit, 'scale')
-        scaleit.text = scale
-        iconit = ET.SubElement(isit, 'Icon')
-        hrefit = ET.SubElement(iconit, 'href')
-        hrefit.text = "http://maps.google.com/mapfiles/kml/pushpin/ylw-pushpin.png"
-        hsit = ET.SubElement(isit, 'hotSpot', x="20", y="2", xunits="pixels", yunits="pixels")
-        lsit = ET.SubElement(styleit, 'LineStyle')
-        colit = ET.SubElement(lsit, 'color')
-        colit.text = "ff"+color
-        return sroot
-
-    def genstyles(self):
-        # Create style section for each color
-        sroot = ET.Element('root')
-        for color in self.linecolors:
-            sroot.extend(self.genstyle(color))
-        for color in self.labelcolors:
-            sroot.extend(self.genstyle(color))
-        return sroot
-
-    def genstyle(self, color):
-        # print(vrccolors.defaultcolors[color])
-        # Return a style so we can color the lines
-        # Create a map and style IDs
-        mapid = "m_" + color
-        styleid = "s_" + color
-        styleidhl = styleid + "_hl"
-        pushurl = "http://maps.google.com/mapfiles/kml/pushpin/ylw-pushpin.png"
-        #colorhex = self.htmlcolortokml(color)
-        colorhex = "ffffffff"
-
-        sroot = ET.Element('root')
-        smap = ET.SubElement(sroot, 'StyleMap', id=mapid)
-        smap.extend(self.stylepair("normal", styleid))
-        smap.extend(self.stylepair("highlight", styleidhl))
-        sroot.extend(self.style(styleidhl, "1.3", colorhex))
-        sroot.extend(self.style(styleid, "1.1", colorhex))
-        return sroot
+    def stylecolors(self):
+        # Colors that need a style, lines then labels
+        return list(self.linecolors) + list(self.labelcolors)
 
-    def newpmark(self, parent, color, name="Untitled Path"):
-        # Create a new placemark under parent
-        pmark = ET.SubElement(parent, 'Placemark')
-        pname = ET.SubElement(pmark, 'name')
-        pname.text = name
-        surl = ET.SubElement(pmark, 'styleUrl')
-        surl.text = "#m_"+color
-        return pmark
-
-    def makelinestring(self, clist, color):
-        # Create a new linestring item with coord list
-        sroot = ET.Element('root')
-        pmark = self.newpmark(sroot, color)
-        lsit = ET.SubElement(pmark, 'LineString')
-        tess = ET.SubElement(lsit, 'tessellate')
-        tess.text = "1"
-        coordit = ET.SubElement(lsit, 'coordinates')
-        coordit.text = " ".join(["%s,%s,0" % (coord[1], coord[0]) for coord in clist])
-        return sroot
-
-    def makelabel(self, label, color):
-        # Create a new label item
-        # print("Making label item :"+str(label))
-        sroot = ET.Element('root')
-        pmark = self.newpmark(sroot, color, label[1])
-        point = ET.SubElement(pmark, 'Point')
-        coordit = ET.SubElement(point, 'coordinates')
-        coordit.text = "%s,%s,0" % (label[0][1], label[0][0])
-        return sroot
-
-    def writekml(self, file):
+    def writekml(self, file, level=6):
         # Take the apd info and write KML file with it
-        # Set up the basic header fields
-        kroot = ET.Element('kml')
-        hdratt = [("xmlns", "http://www.opengis.net/kml/2.2"),
-                  ("xmlns:gx", "http://www.google.com/kml/ext/2.2"),
-                  ("xmlns:kml", "http://www.opengis.net/kml/2.2"),
-                  ("xmlns:atom", "http://www.w3.org/2005/Atom")]
-        for att in hdratt:
-            kroot.set(*att)
-        rootdoc = ET.SubElement(kroot, 'Document')
-        rootname = ET.SubElement(rootdoc, 'name')
-        rootname.text = self.name+".kml"
-        # Add styles
-        rootdoc.extend(self.genstyles())
-        # Create basic folder layout
-        zseapd = self.newsubfol(rootdoc, 'ZSE Airport Diagrams', 1)
-        currdia = self.newsubfol(zseapd, 'Current Diagrams', 1)
-        # olddia = self.newsubfol(zseapd, 'Old Diagram Ref')
-        # Create folder for this airport
-        aptfol = self.newsubfol(currdia, self.name, 1)
-        # Add all of the lines
-        for color, lists in self.linecolors.items():
-            # Create subfolder for the color
-            csub = self.newsubfol(aptfol, color)
-            for clist in lists:
-                csub.extend(self.makelinestring(clist, color))
-        # Add all of the labels
-        for color, labels in self.labelcolors.items():
-            # Create subfolder for the color
-            csub = self.newsubfol(aptfol, color)
-            for label in labels:
-                csub.extend(self.makelabel(label, color))
-
-        # Make it pretty and write the file
-        dom = xml.dom.minidom.parseString(ET.tostring(kroot))
-        pretty_xml_as_string = dom.toprettyxml(indent="    ")
-        with open(file, 'w') as kfile:
-            kfile.write(pretty_xml_as_string)
-
-def findlines(filename):
+        # A .kmz file is compressed at level
+        with kmlwriter.opendoc(file, level) as kfile:
+            kml = kmlwriter.kmlwriter(kfile)
+            kml.startdoc(self.name+".kml")
+            # Add styles
+            for color in self.stylecolors():
+                #colorhex = vrccolors.getregistry().kml(color.lower())
+                kml.stylemap(color, "ffffffff")
+            # Create basic folder layout
+            kml.startfolder('ZSE Airport Diagrams', 1)
+            kml.startfolder('Current Diagrams', 1)
+            # Create folder for this airport
+            kml.startfolder(self.name, 1)
+            # Add all of the lines
+            for color, lists in self.linecolors.items():
+                # Create subfolder for the color
+                kml.startfolder(color)
+                for clist in lists:
+                    kml.linestring(clist, color)
+                kml.end()
+            # Add all of the labels
+            for color, labels in self.labelcolors.items():
+                # Create subfolder for the color
+                kml.startfolder(color)
+                for label in labels:
+                    # print("Making label item :"+str(label))
+                    kml.point(label[0], label[1], color)
+                kml.end()
+            kml.enddoc()
+
+def findlines(filename, ext=".kml", level=6):
     # masterdir = Path(masterdir)
     name = ""
     type = ""
@@ -251,9 +131,9 @@ def findlines(filename):
                 apt.addline(path['lines'], l)
 
     masterdir = Path(filename).parent.absolute()
-    kmlfn = defdict['icao'] + ".kml"
+    kmlfn = defdict['icao'] + ext
     kmlfile = masterdir / kmlfn
-    apt.writekml(kmlfile)
+    apt.writekml(kmlfile, level)
 
     # kmlfn = apt + ".kml"
     # kmlfile = masterdir / kmlfn
@@ -315,6 +195,17 @@ def findlines(filename):
     # apd.writekml(kmlfile)
 
 
-# filename = sys.argv[2]
-filename = Path(sys.argv[1])
-findlines(filename)
+def main():
+    parser = argparse.ArgumentParser(description="Convert a TowerTrainer .apt file to kml")
+    parser.add_argument("aptfile", help=".apt file, the kml is saved next to it")
+    parser.add_argument("-z", "--zip", action="store_true", help="write a compressed kmz instead of kml")
+    parser.add_argument("--level", type=int, default=6, choices=range(10), metavar="0-9",
+                        help="compression level for KMZ output, 0 to store it uncompressed (default: 6)")
+    args = parser.parse_args()
+    # filename = sys.argv[2]
+    filename = Path(args.aptfile)
+    findlines(filename, ".kmz" if args.zip else ".kml", args.level)
+
+
+if __name__ == "__main__":
+    main()
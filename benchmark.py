@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+# Times the main steps of each tool on made up inputs from synthetic.py
+# Each step is timed on its own, the best of a few runs is kept
+# Results can be saved as JSON and compared against a saved baseline,
+# anything slower than the baseline by more than the threshold fails
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+import apd2kml
+import apt2kml
+import glyphs
+import kmzfile
+import sectorfile
+import synthetic
+
+
+def timestep(name, setup, run, repeat):
+    # Best time of repeat runs, setup isn't timed and gives run what it works on
+    times = []
+    for i in range(repeat):
+        state = setup()
+        # The tools print a lot, it's not what we're timing
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter()-start)
+    print("%-16s %9.3f s" % (name, min(times)))
+    return {"best": min(times), "times": times}
+
+
+def quiet(func, *args):
+    # Run something untimed without its output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return func(*args)
+
+
+def fontproblem(path):
+    # Why labels can't be drawn as lines with this font, or None if they can
+    if importlib.util.find_spec("freetype") is None:
+        return "freetype-py isn't installed"
+    if not Path(path).is_file():
+        return "no font at "+str(path)
+    return None
+
+
+def strokes(diags, magvar):
+    # Arguments for each drawstring call renderdiagram makes, see sectorfileobj.renderdiagram
+    calls = []
+    for diag in diags.values():
+        for objs in diag.cats.values():
+            for color, linelist in objs['lines'].items():
+                for name, coords, desc in linelist:
+                    if desc == "plot=True" and name.split('_')[0] not in ("dashed", "circle", "arc"):
+                        scale = sectorfile.cosinedist(coords[0], coords[1])
+                        vert = sectorfile.coordbrng(coords[0], coords[1]) + magvar
+                        calls.append((coords[0], name, color, scale, vert+90))
+            for color, lbls in objs['labels'].items():
+                for point in lbls:
+                    if point[3] == "plot=True":
+                        calls.append(((point[1], point[2]), point[0], color, 5, 90))
+                    elif color == synthetic.strokedcolor:
+                        calls.append(((point[1], point[2]), point[0], color, .04, 90))
+    return calls
+
+
+def runall(directory, scale, repeat, font):
+    # Make the inputs, then time each step
+    # The font's glyphs are loaded fresh for each run, like a new process would
+    print("Writing inputs to "+str(directory))
+    apts, sct2, kmz, aptfiles = synthetic.writeset(directory, scale["airports"], scale["placemarks"],
+                                                   scale["sidlines"], scale["labels"], scale["geo"], scale["seed"],
+                                                   scale["stroked"])
+    synthetic.register(apts)
+    names = [name for name, loc in apts]
+    outdir = directory / "out"
+    outdir.mkdir(exist_ok=True)
+    diags = quiet(kmzfile.readkmz, kmz)
+
+    def sector():
+        return sectorfile.sectorfileobj(synthetic.sectorname, directory, synthetic.airac, "b")
+
+    def fresh():
+        # Sector file and an empty glyph cache
+        glyphs.setfont(font)
+        return quiet(sector)
+
+    def added():
+        # Sector file with the new diagrams already in it
+        sectorobj = fresh()
+        quiet(sectorobj.addnewdiagrams, diags)
+        return sectorobj
+
+    def apdout(apds):
+        for apd in apds.values():
+            apd.writekml(outdir / (apd.name+".kml"))
+
+    def aptout(files):
+        for aptfile in files:
+            apt2kml.findlines(aptfile)
+
+    results = {}
+    results["readkmz"] = timestep("readkmz", lambda: kmz, kmzfile.readkmz, repeat)
+    results["getsections"] = timestep("getsections", lambda: None, lambda state: sector(), repeat)
+    # addnewdiagrams renders every airport and prunes the labels, prunelabels is also timed alone
+    results["addnewdiagrams"] = timestep("addnewdiagrams", fresh,
+                                         lambda sectorobj: sectorobj.addnewdiagrams(diags), repeat)
+    if scale["stroked"]:
+        # Drawing labels as lines, also part of addnewdiagrams
+        sectorobj = quiet(sector)
+        calls = strokes(diags, sectorobj.magvar)
+        print("Drawing %i labels as lines" % len(calls))
+
+        def drawall(calls):
+            lines = []
+            for call in calls:
+                lines.extend(sectorobj.drawstring(*call))
+        results["drawstring"] = timestep("drawstring", lambda: glyphs.setfont(font) or calls, drawall, repeat)
+    results["prunelabels"] = timestep("prunelabels", lambda: quiet(sector),
+                                      lambda sectorobj: sectorobj.prunelabels(names), repeat)
+    results["write"] = timestep("write", added, lambda sectorobj: sectorobj.write(), repeat)
+    results["apd2kml"] = timestep("apd2kml", lambda: None,
+                                  lambda state: apdout(apd2kml.findlines(directory, names)), repeat)
+    results["apt2kml"] = timestep("apt2kml", lambda: aptfiles, aptout, repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Steps that got slower than the baseline by more than threshold (0.1 is 10%)
+    slower = []
+    for name, result in results["steps"].items():
+        if name not in baseline["steps"]:
+            print("%-16s not in baseline" % name)
+            continue
+        old = baseline["steps"][name]["best"]
+        change = result["best"]/old-1 if old else 0
+        flag = change > threshold
+        print("%-16s %9.3f s vs %9.3f s  %+6.1f%%%s" % (name, result["best"], old, change*100, "  SLOWER" if flag else ""))
+        if flag:
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each tool's main steps on made up inputs")
+    parser.add_argument("--airports", type=int, default=29, help="number of airports (default: %(default)s)")
+    parser.add_argument("--placemarks", type=int, default=100, help="kmz placemarks per airport (default: %(default)s)")
+    parser.add_argument("--sid-lines", type=int, default=200, help="old SID segments per airport (default: %(default)s)")
+    parser.add_argument("--labels", type=int, default=50, help="old labels per airport (default: %(default)s)")
+    parser.add_argument("--geo", type=int, default=5000, help="GEO lines (default: %(default)s)")
+    parser.add_argument("--stroked", type=int, default=6,
+                        help="labels per airport drawn as lines, needs freetype-py and a font (default: %(default)s)")
+    parser.add_argument("--font", help="single stroke font for drawn labels (default: $"+glyphs.envvar+" or "+glyphs.defaultfont+")")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each step, the best is kept (default: %(default)s)")
+    parser.add_argument("--workdir", help="where to write the inputs and outputs (default: a temporary directory)")
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="how much slower than the baseline a step can be, 0.2 is 20%% (default: %(default)s)")
+    args = parser.parse_args()
+    if args.airports < 1 or args.repeat < 1:
+        parser.error("--airports and --repeat have to be at least 1")
+    if args.threshold < 0:
+        parser.error("--threshold can't be negative")
+
+    font = str(glyphs.glyphcache(args.font).path)
+    stroked = args.stroked
+    problem = fontproblem(font)
+    if stroked and problem:
+        print("Not drawing labels as lines, "+problem+" (see --font)")
+        stroked = 0
+    scale = {"airports": args.airports, "placemarks": args.placemarks, "sidlines": args.sid_lines,
+             "labels": args.labels, "geo": args.geo, "seed": args.seed, "stroked": stroked}
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != scale:
+            # Times at different sizes can't be compared
+            parser.error("baseline was run at "+json.dumps(baseline.get("scale"), sort_keys=True))
+    if args.workdir:
+        steps = runall(Path(args.workdir), scale, args.repeat, font)
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            steps = runall(Path(tmpdir), scale, args.repeat, font)
+    results = {"scale": scale, "repeat": args.repeat, "python": platform.python_version(),
+               "machine": platform.machine(), "steps": steps}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if baseline is not None:
+        slower = compare(results, baseline, args.threshold)
+        if slower:
+            print("Slower than baseline: "+", ".join(slower))
+            sys.exit(1)
+        print("No steps slower than baseline")
+
+
+if __name__ == "__main__":
+    main()
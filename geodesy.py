@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+# Distance, bearing and destination on a sphere, in nmi and degrees
+# cosinedist/coordbrng/coordbrgdist work on one pair of points at a time
+# distance/bearing/destination do whole lists at once with the same formulas,
+# so they give the same numbers, but trig of anything shared is only done once
+# Batch inputs broadcast: one point against many, or many against as many
+# Also converts between decimal degrees and the sct2 [NSEW]DDD.MM.SS.SSS format
+
+import functools
+import math
+import re
+from array import array
+
+# Earth radius in nmi
+R = 3440.06479
+
+
+def cosinedist(coord1, coord2):  # Use cosine to find distance between coordinates
+    # Split into lat/lon
+    lat1, lon1 = coord1
+    lat2, lon2 = coord2
+    # Convert latitudes to radians, get difference
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dellamb = math.radians(lon2-lon1)
+    # gives d in Nmi
+    d = math.acos(math.sin(phi1)*math.sin(phi2) + math.cos(phi1)*math.cos(phi2) * math.cos(dellamb)) * R
+    return d
+
+
+def coordbrng(coord1, coord2):  # Find heading between coordinates
+    phi1 = math.radians(coord1[0])
+    phi2 = math.radians(coord2[0])
+    lamb1 = math.radians(coord1[1])
+    lamb2 = math.radians(coord2[1])
+    y = math.sin(lamb2-lamb1) * math.cos(phi2)
+    x = math.cos(phi1)*math.sin(phi2) - math.sin(phi1)*math.cos(phi2)*math.cos(lamb2-lamb1)
+    brng = math.degrees(math.atan2(y, x))
+    if brng < 0:
+        brng += 360
+    return brng
+
+
+def coordbrgdist(coord, brng, dist):
+    # Point dist nmi from coord on bearing brng (radians)
+    angdist = dist / R
+    phi = math.radians(coord[0])
+    lat = math.degrees(math.asin(math.sin(phi) * math.cos(angdist) + math.cos(phi) * math.sin(angdist) * math.cos(brng)))
+    lon = coord[1] + math.degrees(math.atan2(math.sin(brng) * math.sin(angdist) * math.cos(phi), math.cos(angdist) - math.sin(phi) * math.sin(math.radians(lat))))
+    return (lat, lon)
+
+
+def columns(coords):
+    # Lats and lons of one point (lat, lon), a packed lat/lon array,
+    # a coordseq, or a list of (lat, lon)
+    if isinstance(coords, array):
+        return coords[0::2], coords[1::2]
+    if hasattr(coords, "flat"):
+        packed = coords.flat()
+        return packed[0::2], packed[1::2]
+    if len(coords) == 2 and not hasattr(coords[0], "__len__"):
+        return [coords[0]], [coords[1]]
+    return [c[0] for c in coords], [c[1] for c in coords]
+
+
+def values(vals):
+    # A single number or a list of them
+    if hasattr(vals, "__len__"):
+        return vals
+    return [vals]
+
+
+def broadcast(*cols):
+    # Repeat single values to the length of the other columns
+    sizes = set(len(col) for col in cols if len(col) != 1)
+    if len(sizes) > 1:
+        raise ValueError("Can't broadcast lists of "+", ".join(str(size) for size in sorted(sizes))+" points together")
+    size = sizes.pop() if sizes else 1
+    return [list(col)*size if len(col) != size else col for col in cols]
+
+
+def distance(coords1, coords2):
+    # cosinedist between points, as an array of nmi
+    lat1, lon1 = columns(coords1)
+    lat2, lon2 = columns(coords2)
+    # Trig of each latitude is worked out before they're repeated
+    phi1 = list(map(math.radians, lat1))
+    phi2 = list(map(math.radians, lat2))
+    sin1, cos1, lon1, sin2, cos2, lon2 = broadcast(
+        list(map(math.sin, phi1)), list(map(math.cos, phi1)), lon1,
+        list(map(math.sin, phi2)), list(map(math.cos, phi2)), lon2)
+    acos = math.acos
+    cos = math.cos
+    radians = math.radians
+    dists = array('d', bytes(8*len(lon1)))
+    for i in range(len(lon1)):
+        x = sin1[i]*sin2[i] + cos1[i]*cos2[i] * cos(radians(lon2[i]-lon1[i]))
+        # Same point can come out a hair over 1
+        dists[i] = acos(x) * R if x < 1 else 0.0
+    return dists
+
+
+def bearing(coords1, coords2):
+    # coordbrng between points, as an array of degrees 0-360
+    lat1, lon1 = columns(coords1)
+    lat2, lon2 = columns(coords2)
+    phi1 = list(map(math.radians, lat1))
+    phi2 = list(map(math.radians, lat2))
+    lamb1 = list(map(math.radians, lon1))
+    lamb2 = list(map(math.radians, lon2))
+    sin1, cos1, lamb1, sin2, cos2, lamb2 = broadcast(
+        list(map(math.sin, phi1)), list(map(math.cos, phi1)), lamb1,
+        list(map(math.sin, phi2)), list(map(math.cos, phi2)), lamb2)
+    sin = math.sin
+    cos = math.cos
+    atan2 = math.atan2
+    degrees = math.degrees
+    brngs = array('d', bytes(8*len(lamb1)))
+    for i in range(len(lamb1)):
+        dlamb = lamb2[i]-lamb1[i]
+        y = sin(dlamb) * cos2[i]
+        x = cos1[i]*sin2[i] - sin1[i]*cos2[i]*cos(dlamb)
+        brng = degrees(atan2(y, x))
+        if brng < 0:
+            brng += 360
+        brngs[i] = brng
+    return brngs
+
+
+def destination(coords, brngs, dists):
+    # coordbrgdist from points along bearings (radians) for distances (nmi)
+    # Returns a packed lat/lon array
+    brngs = values(brngs)
+    return destinationtrig(coords, list(map(math.sin, brngs)), list(map(math.cos, brngs)), dists)
+
+
+def destinationtrig(coords, sinb, cosb, dists):
+    # destination with the bearings given by their sines and cosines
+    lat0, lon0 = columns(coords)
+    dists = values(dists)
+    phi = list(map(math.radians, lat0))
+    angdist = [dist / R for dist in dists]
+    sinphi, cosphi, lon0, sinad, cosad, sinb, cosb = broadcast(
+        list(map(math.sin, phi)), list(map(math.cos, phi)), lon0,
+        list(map(math.sin, angdist)), list(map(math.cos, angdist)),
+        sinb, cosb)
+    sin = math.sin
+    asin = math.asin
+    atan2 = math.atan2
+    degrees = math.degrees
+    radians = math.radians
+    points = array('d', bytes(16*len(lon0)))
+    for i in range(len(lon0)):
+        lat = degrees(asin(sinphi[i] * cosad[i] + cosphi[i] * sinad[i] * cosb[i]))
+        points[2*i] = lat
+        points[2*i+1] = lon0[i] + degrees(atan2(sinb[i] * sinad[i] * cosphi[i], cosad[i] - sinphi[i] * sin(radians(lat))))
+    return points
+
+
+@functools.lru_cache(maxsize=256)
+def unitarc(start, sweep, segments):
+    # Sines and cosines of bearings splitting an arc into equal segments
+    # start and sweep in radians, clockwise, gives segments+1 bearings
+    # A whole circle ends exactly where it started
+    brngs = [start + sweep*i/segments for i in range(segments+1)]
+    sins = [math.sin(brng) for brng in brngs]
+    coss = [math.cos(brng) for brng in brngs]
+    if sweep >= 2*math.pi:
+        sins[-1] = sins[0]
+        coss[-1] = coss[0]
+    return tuple(sins), tuple(coss)
+
+
+# sct2 format of a lat lon pair, [NSEW]DDD.MM.SS.SSS
+dmsformat = "%s%03.f.%02.f.%06.3f %s%03.f.%02.f.%06.3f"
+
+
+def ddtodms(lat, lon):
+    # Convert decimal degrees to the sct2 format of [NSEW]DDD.MM.SS.SSS
+    # First get the NSEW directions
+    latdir = "N" if lat > 0 else "S"
+    londir = "E" if lon > 0 else "W"
+    # Take out any negatives
+    lat = abs(lat)
+    lon = abs(lon)
+    # Round down to integers
+    latdeg = int(lat)
+    londeg = int(lon)
+    # Get minutes
+    latdmin = (lat-latdeg)*60
+    londmin = (lon-londeg)*60
+    # Get seconds
+    latdsec = (latdmin - int(latdmin))*60
+    londsec = (londmin - int(londmin))*60
+    # Assemble the strings
+    # Return the lat lon pair in VRC format
+    coordstr = dmsformat % (latdir, latdeg, int(latdmin), latdsec, londir, londeg, int(londmin), londsec)
+    return coordstr
+
+
+def ddtodmsbatch(packed):
+    # ddtodms for a whole packed array of lat0, lon0, lat1, lon1...
+    # Gives the same strings, just without a call per point
+    dms = []
+    append = dms.append
+    for lat, lon in zip(packed[0::2], packed[1::2]):
+        latdir = "N" if lat > 0 else "S"
+        londir = "E" if lon > 0 else "W"
+        lat = abs(lat)
+        lon = abs(lon)
+        latdeg = int(lat)
+        londeg = int(lon)
+        latdmin = (lat-latdeg)*60
+        londmin = (lon-londeg)*60
+        latimin = int(latdmin)
+        lonimin = int(londmin)
+        append(dmsformat % (latdir, latdeg, latimin, (latdmin-latimin)*60,
+                            londir, londeg, lonimin, (londmin-lonimin)*60))
+    return dms
+
+
+def dmstodd(clist):
+    # ["N000.00.00.000","E000.00.00.000"]
+    # Get the letters
+    latletter = clist[0][:1]
+    lonletter = clist[1][:1]
+    # Start with positive/negative based on letters
+    declat = 1 if latletter == "N" else -1
+    declon = 1 if lonletter == "E" else -1
+    # print(clist)
+    # Split by decimals, exclude leading letters
+    latelems = clist[0][1:].split('.')
+    lonelems = clist[1][1:].split('.')
+    # print(latelems)
+    # print(lonelems)
+    # Calculate decimal degrees
+    # Multiply by itself which was set above as positive/negative by letter
+    # print(latelems)
+    # print(lonelems)
+    declat *= int(latelems[0])+int(latelems[1])/60+float(latelems[2]+"."+latelems[3])/3600
+    declon *= int(lonelems[0])+int(lonelems[1])/60+float(lonelems[2]+"."+lonelems[3])/3600
+    return (declat, declon)
+
+
+# Sign for each direction letter
+dmssigns = {"N": 1, "S": -1, "E": 1, "W": -1}
+# [NSEW]DDD.MM.SS.SSS, split into the parts dmstodd uses
+re_dms = re.compile(r'([NSEW])(\d+)\.(\d+)\.(\d+\.\d+)$')
+
+
+def dmstoddbatch(tokens):
+    # dmstodd for a whole list of tokens, lat or lon in any order
+    # ["N047.26.58.100", "W122.18.33.400", ...]
+    # Gives an array of decimal degrees in the same order, and a list of the
+    # indexes of tokens that couldn't be read, which are NaN in the array
+    decimal = array('d', bytes(8*len(tokens)))
+    bad = []
+    match = re_dms.match
+    for i, token in enumerate(tokens):
+        m = match(token)
+        if m is None:
+            decimal[i] = math.nan
+            bad.append(i)
+        else:
+            letter, deg, mins, secs = m.groups()
+            decimal[i] = dmssigns[letter] * (int(deg)+int(mins)/60+float(secs)/3600)
+    return decimal, bad
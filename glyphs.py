@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# Character outlines from a single stroke font, for drawing labels as lines
+# The font is opened once and each character is only loaded from it the
+# first time it's used, after that its contours come from the cache
+# freetype is only imported when a character is actually needed
+
+import os
+
+# Font to use if none is given, can be overridden with this environment variable
+# Excellent single stroke - machtgth.ttf
+envvar = "KMZTOSCT2_FONT"
+defaultfont = "machtgth.ttf"
+
+
+class glyphcache:
+    # Size the outlines are loaded at, font points come out about 1000 tall
+    charsize = 16*90
+    # Outline points are divided by this so a character is about 1 unit tall
+    units = 1000
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(envvar) or defaultfont
+        self.face = None
+        # Character -> (contours, width, advance, far)
+        self.glyphs = {}
+
+    def loadface(self):
+        # Open the font the first time it's needed
+        import freetype
+        self.face = freetype.Face(str(self.path))
+        self.face.set_char_size(self.charsize)
+        self.flags = freetype.FT_LOAD_DEFAULT | freetype.FT_LOAD_NO_BITMAP
+
+    def glyph(self, c):
+        # Contours, width, advance and furthest point of a character
+        # Contours are lists of (x, y), closed where the font says so
+        # Width is how far the points spread across, advance is how far the font moves on
+        # Far is the point furthest from the origin, or None if there are no points
+        glyph = self.glyphs.get(c)
+        if glyph is None:
+            glyph = self.glyphs[c] = self.loadglyph(c)
+        return glyph
+
+    def loadglyph(self, c):
+        if self.face is None:
+            self.loadface()
+        self.face.load_char(c, self.flags)
+        slot = self.face.glyph
+        outline = slot.outline
+        contours = []
+        start = 0
+        for end in outline.contours:
+            path = [(x/self.units, y/self.units) for x, y in outline.points[start:end+1]]
+            if outline.tags[end] == 0:
+                path.append(path[0])
+            contours.append(path)
+            start = end+1
+        points = [pair for path in contours for pair in path]
+        if points:
+            xs = [x for x, y in points]
+            width = max(xs)-min(xs)
+            far = max(points, key=lambda pair: pair[0]*pair[0]+pair[1]*pair[1])
+        else:
+            width = 0
+            far = None
+        return contours, width, slot.advance.x/64/self.units, far
+
+    def contours(self, c):
+        return self.glyph(c)[0]
+
+    def width(self, c):
+        return self.glyph(c)[1]
+
+    def advance(self, c):
+        return self.glyph(c)[2]
+
+    def far(self, c):
+        return self.glyph(c)[3]
+
+
+# Glyphs for the configured font, shared by everything in this process
+fontpath = None
+cache = None
+
+
+def setfont(path):
+    # Use a different font from now on
+    global fontpath, cache
+    fontpath = path
+    cache = None
+
+
+def getfont():
+    # Glyph cache for the configured font, made the first time it's asked for
+    global cache
+    if cache is None:
+        cache = glyphcache(fontpath)
+    return cache
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+# Writes KML straight to a file as it goes, indented 4 spaces
+# Output is laid out the same as minidom's toprettyxml, so files match
+# the ones built with ElementTree, without holding the whole document
+# opendoc gives a file to write to, either plain kml or doc.kml inside a kmz
+
+import contextlib
+import io
+from pathlib import Path
+
+# Namespaces on the kml tag
+kmlattrs = [("xmlns", "http://www.opengis.net/kml/2.2"),
+            ("xmlns:gx", "http://www.google.com/kml/ext/2.2"),
+            ("xmlns:kml", "http://www.opengis.net/kml/2.2"),
+            ("xmlns:atom", "http://www.w3.org/2005/Atom")]
+
+pushurl = "http://maps.google.com/mapfiles/kml/pushpin/ylw-pushpin.png"
+
+
+@contextlib.contextmanager
+def opendoc(file, level=6):
+    # Text file to write a KML document to
+    # A .kmz name gets a zip with doc.kml in it, compressed at level (0 stores it as is)
+    # The kml is compressed as it's written, there's no temporary file
+    if Path(file).suffix.lower() != ".kmz":
+        with open(file, 'w') as out:
+            yield out
+        return
+    # Only needed for kmz, so plain kml doesn't pay for it
+    from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+    if level:
+        kmz = ZipFile(file, 'w', ZIP_DEFLATED, compresslevel=level)
+    else:
+        kmz = ZipFile(file, 'w', ZIP_STORED)
+    with kmz:
+        with io.TextIOWrapper(kmz.open('doc.kml', 'w'), encoding='utf-8') as out:
+            yield out
+
+
+def escape(text):
+    # Same characters minidom escapes
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+class kmlwriter:
+    indent = "    "
+
+    def __init__(self, out):
+        # out is an open text file
+        self.out = out
+        # Tags of the elements we're inside of
+        self.stack = []
+
+    def opentag(self, tag, attrs):
+        # Start of a tag, at the current depth
+        self.out.write(self.indent*len(self.stack)+"<"+tag)
+        for name, value in attrs:
+            self.out.write(" %s=\"%s\"" % (name, escape(value)))
+
+    def start(self, tag, attrs=()):
+        # Open an element that will have other elements in it
+        self.opentag(tag, attrs)
+        self.out.write(">\n")
+        self.stack.append(tag)
+
+    def end(self):
+        # Close the last element opened
+        tag = self.stack.pop()
+        self.out.write(self.indent*len(self.stack)+"</"+tag+">\n")
+
+    def leaf(self, tag, text=None, attrs=()):
+        # Element with just text in it, or nothing at all
+        self.opentag(tag, attrs)
+        if text:
+            self.out.write(">"+escape(text)+"</"+tag+">\n")
+        else:
+            self.out.write("/>\n")
+
+    def startdoc(self, name):
+        # XML header, kml tag and the Document
+        self.out.write('<?xml version="1.0" ?>\n')
+        self.start('kml', kmlattrs)
+        self.start('Document')
+        self.leaf('name', name)
+
+    def enddoc(self):
+        # Close everything still open
+        while self.stack:
+            self.end()
+
+    def startfolder(self, name, open=0):
+        # Open a folder, closed with end()
+        self.start('Folder')
+        self.leaf('name', name)
+        if open:  # Whether folder is expanded
+            self.leaf('open', "1")
+
+    def stylepair(self, key, surl):
+        # Style pair for normal/highlighted
+        self.start('Pair')
+        self.leaf('key', key)
+        self.leaf('styleUrl', "#"+surl)
+        self.end()
+
+    def style(self, styleid, scale, color):
+        # Style definition for color
+        self.start('Style', [("id", styleid)])
+        self.start('IconStyle')
+        self.leaf('scale', scale)
+        self.start('Icon')
+        self.leaf('href', pushurl)
+        self.end()
+        self.leaf('hotSpot', attrs=[("x", "20"), ("y", "2"), ("xunits", "pixels"), ("yunits", "pixels")])
+        self.end()
+        self.start('LineStyle')
+        self.leaf('color', "ff"+color)
+        self.end()
+        self.end()
+
+    def stylemap(self, color, colorhex):
+        # Styles so we can color the lines
+        # Create a map and style IDs
+        mapid = "m_" + color
+        styleid = "s_" + color
+        styleidhl = styleid + "_hl"
+        self.start('StyleMap', [("id", mapid)])
+        self.stylepair("normal", styleid)
+        self.stylepair("highlight", styleidhl)
+        self.end()
+        self.style(styleidhl, "1.3", colorhex)
+        self.style(styleid, "1.1", colorhex)
+
+    def startpmark(self, color, name="Untitled Path"):
+        # Open a placemark, closed with end()
+        self.start('Placemark')
+        self.leaf('name', name)
+        self.leaf('styleUrl', "#m_"+color)
+
+    def linestring(self, clist, color):
+        # Placemark for a line through a list of (lat, lon)
+        self.startpmark(color)
+        self.start('LineString')
+        self.leaf('tessellate', "1")
+        if len(clist):
+            # Coordinates go out one at a time rather than joined up first
+            out = self.out
+            out.write(self.indent*len(self.stack)+"<coordinates>")
+            sep = ""
+            for coord in clist:
+                out.write(sep+"%s,%s,0" % (coord[1], coord[0]))
+                sep = " "
+            out.write("</coordinates>\n")
+        else:
+            self.leaf('coordinates')
+        self.end()
+        self.end()
+
+    def point(self, coords, name, color):
+        # Placemark for a label at (lat, lon)
+        self.startpmark(color, name)
+        self.start('Point')
+        self.leaf('coordinates', "%s,%s,0" % (coords[1], coords[0]))
+        self.end()
+        self.end()
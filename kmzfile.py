@@ -1,249 +1,274 @@
 #!/usr/bin/env python
-import xml.etree.ElementTree as etree
-from zipfile import ZipFile
+# XML, zip and hashing modules are imported by the functions that use them,
+# so importing this for coordseq alone stays cheap
+import operator
+from array import array
+
+
+# Number of commas in a coordinate, for checking all points have the same fields
+countcommas = operator.methodcaller('count', ',')
 
 
 class newAirportDiag:
+    # Everything for one airport is kept in flat arrays rather than lists of tuples
+    # Strings (names, descriptions, colors, categories) are stored once and referred to by number
+    # cats builds the nested category/color layout on top of this when it's read
 
     def __init__(self):
         # self.aptname = ""
-        # Each dict has color as the key
-        # Each key is a list of the elements to draw in that color
-        self.apdlines = {}
-        self.reflines = {}
-        self.labels = {}
-        self.reflabels = {}
+        # Interned strings, and the number of each
+        self.strings = []
+        self.stringids = {}
+        # Categories in the order they were first used
+        self.catorder = {}
+        # Points of every line, packed as lat0, lon0, lat1, lon1...
+        self.coords = array('d')
+        # For each line, where its points start/end in coords and its strings
+        self.linestart = array('I')
+        self.lineend = array('I')
+        self.linename = array('I')
+        self.linedesc = array('I')
+        self.linecolor = array('I')
+        self.linecat = array('I')
+        # For each label, lat, lon packed like coords and its strings
+        self.lblcoords = array('d')
+        self.lblname = array('I')
+        self.lbldesc = array('I')
+        self.lblcolor = array('I')
+        self.lblcat = array('I')
 
-        self.cats = {}
+    def intern(self, string):
+        # Number for this string, adding it if it's new
+        sid = self.stringids.get(string)
+        if sid is None:
+            sid = len(self.strings)
+            self.strings.append(string)
+            self.stringids[string] = sid
+        return sid
 
     def addlabel(self, label, color, cat):
         # label: (name, lat, lon, desc)
-        if cat not in self.cats:
-            #print("  Init cat "+str(len(self.cats)+1)+": "+cat)
-            self.cats[cat] = {'lines': {}, 'labels': {}}
-            #print(self.cats)
-        if color not in self.cats[cat]['labels']:
-            #print("   Init color: "+color)
-            self.cats[cat]['labels'][color] = []
-        # Add this label to the right color
-        self.cats[cat]['labels'][color].append(label)
+        catid = self.intern(cat)
+        self.catorder.setdefault(catid)
+        self.lblcoords.append(label[1])
+        self.lblcoords.append(label[2])
+        self.lblname.append(self.intern(label[0]))
+        self.lbldesc.append(self.intern(label[3]))
+        self.lblcolor.append(self.intern(color))
+        self.lblcat.append(catid)
 
     def addline(self, name, coordlist, desc, color, cat):
-        if cat not in self.cats:
-            #print("  Init cat "+str(len(self.cats)+1)+": "+cat)
-            self.cats[cat] = {'lines': {}, 'labels': {}}
-            #print(self.cats)
-        if color not in self.cats[cat]['lines']:
-            #print("   Init color: "+color)
-            self.cats[cat]['lines'][color] = []
-        # Add this label to the right color
-        self.cats[cat]['lines'][color].append((name, coordlist, desc))
-    #
-    # def addlabel(self, label, color):
-    #     # Add a new regular label
-    #     # Check if new color to be initialized
-    #     if color not in self.labels:
-    #         self.labels[color] = []
-    #     # Add this label to the right color
-    #     self.labels[color].append(label)
-    #
-    # def addline(self, name, coordlist, color):
-    #     if color not in self.apdlines:
-    #         self.apdlines[color] = []
-    #     self.apdlines[color].append((name, coordlist))
-    #
-    # def addreflabel(self, label, color):
-    #     if color not in self.reflabels:
-    #         self.reflabels[color] = []
-    #     self.reflabels[color].append(label)
-    #
-    # def addrefline(self, coordlist, color):
-    #     if color not in self.reflines:
-    #         self.reflines[color] = []
-    #     self.reflines[color].append(coordlist)
+        catid = self.intern(cat)
+        self.catorder.setdefault(catid)
+        self.linestart.append(len(self.coords))
+        if isinstance(coordlist, coordseq):
+            self.coords.extend(coordlist.flat())
+        else:
+            for lat, lon in coordlist:
+                self.coords.append(lat)
+                self.coords.append(lon)
+        self.lineend.append(len(self.coords))
+        self.linename.append(self.intern(name))
+        self.linedesc.append(self.intern(desc))
+        self.linecolor.append(self.intern(color))
+        self.linecat.append(catid)
+
+    @property
+    def cats(self):
+        # Layout of the diagram by category, then lines/labels, then color
+        # Lines are (name, coordseq, desc), labels are (name, lat, lon, desc)
+        strings = self.strings
+        cats = {strings[catid]: {'lines': {}, 'labels': {}} for catid in self.catorder}
+        for i in range(len(self.linestart)):
+            colors = cats[strings[self.linecat[i]]]['lines']
+            color = strings[self.linecolor[i]]
+            if color not in colors:
+                colors[color] = []
+            coords = coordseq(self.coords, self.linestart[i], self.lineend[i])
+            colors[color].append((strings[self.linename[i]], coords, strings[self.linedesc[i]]))
+        for i in range(len(self.lblname)):
+            colors = cats[strings[self.lblcat[i]]]['labels']
+            color = strings[self.lblcolor[i]]
+            if color not in colors:
+                colors[color] = []
+            colors[color].append((strings[self.lblname[i]], self.lblcoords[2*i], self.lblcoords[2*i+1],
+                                  strings[self.lbldesc[i]]))
+        return cats
+
+    def digest(self):
+        # Hash of everything in the diagram, used to tell if it changed between runs
+        import hashlib
+        sha = hashlib.sha1(repr(self.strings).encode())
+        for arr in (self.coords, self.linestart, self.lineend, self.linename, self.linedesc,
+                    self.linecolor, self.linecat, self.lblcoords, self.lblname, self.lbldesc,
+                    self.lblcolor, self.lblcat):
+            sha.update(arr.tobytes())
+        return sha.hexdigest()
+
+
+class coordseq:
+    # Lat/lon pairs packed into an array as lat0, lon0, lat1, lon1...
+    # Can be a view of part of a bigger array, from start up to end
+    # Reads like a list of (lat, lon) tuples, but only makes them when asked
+    __slots__ = ("packed", "start", "end")
+
+    def __init__(self, packed=None, start=0, end=None):
+        self.packed = packed if packed is not None else array('d')
+        self.start = start
+        self.end = end if end is not None else len(self.packed)
+
+    def __len__(self):
+        return (self.end-self.start) // 2
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("coordinate index out of range")
+        i = self.start + 2*i
+        return (self.packed[i], self.packed[i+1])
+
+    def __iter__(self):
+        return zip(self.packed[self.start:self.end:2], self.packed[self.start+1:self.end:2])
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def flat(self):
+        # Just these points as a packed array
+        return self.packed[self.start:self.end]
+
+
+def parsecoords(text):
+    # Turn the text of a coordinates tag into packed lat/lon
+    # Coords are lon,lat[,alt] separated by whitespace
+    tokens = (text or "").split()
+    if not tokens:
+        return coordseq()
+    nfields = tokens[0].count(',') + 1
+    if (nfields > 1 and text.count(',') == len(tokens)*(nfields-1)
+            and len(set(map(countcommas, tokens))) == 1):
+        # Every point has the same fields, so lat and lon are every nth value
+        # Convert each column in one go and interleave them
+        values = text.replace(',', ' ').split()
+        # Empty fields (lon,lat,) disappear in the split, those go point by point
+        if len(values) == len(tokens)*nfields:
+            packed = array('d', bytes(16*len(tokens)))
+            packed[0::2] = array('d', list(map(float, values[1::nfields])))
+            packed[1::2] = array('d', list(map(float, values[0::nfields])))
+            return coordseq(packed)
+    # Mixed up list, go point by point
+    packed = array('d')
+    for token in tokens:
+        # Split these out and convert to float
+        cfields = token.split(",")
+        if len(cfields) > 1:  # some lists are empty
+            packed.append(float(cfields[1]))
+            packed.append(float(cfields[0]))
+    return coordseq(packed)
 
 
 def readkmz(kmlfile):
+    import xml.etree.ElementTree as etree
+    from zipfile import ZipFile
     newdiagrams = {}
     kmz = ZipFile(kmlfile, 'r')
     # Open kml doc in kmz
     kml = kmz.open('doc.kml', 'r')  # .read()
     # namespace for XML stuff, required for etree
     ns = {'sfn': 'http://www.opengis.net/kml/2.2'}
-    tree = etree.parse(kml)
-    # print("Tree:")
-    # print(tree)
-    root = tree.getroot()
-    # print("Root:")
-    # print(root)
+    sfn = '{'+ns['sfn']+'}'
     print("Reading Airport Diagram KML...")
-    for document in root:  # Document tag
-        mainfolderfind = document.findall("sfn:Folder", ns)
-        # Main folder with subfolders:
-        # ZSE Airport Diagrams
-        #     Old Diagram Ref
-        #     Current Diagrams
-        #     In Work (ignored)
-        for mainfolder in mainfolderfind:  # Subfolders are per category
-            catfind = mainfolder.findall("sfn:Folder", ns)
-            for cat in catfind:
-                catname = cat.findall("sfn:name", ns)
-                for name in catname:
-                    category = name.text
-                    print("Category: "+category)
-
-                    #if category == "Current Diagrams":
-                    currents = cat.findall("sfn:Folder", ns)
-                    for folder in currents:
-                        elaptname = folder.findall("sfn:name", ns)
-                        for name in elaptname:
-                            aptname = name.text
-                            print(" Apt name: "+aptname)
-                            if aptname not in newdiagrams:
-                                newdiagrams[aptname] = newAirportDiag()
-                        for apttags in folder:  # Subfolders in airport per color group
-                            # print(apttags.tag,apttags.text)
-                            nametag = apttags.findall("sfn:name", ns)
-                            for tag in nametag:
-                                subname = tag.text
-                                #print(" Subfolder: "+subname)
-                                placemarks = apttags.findall("sfn:Placemark", ns)
-                                # keep track of which line we are on
-                                apdi = 0
-                                for pm in placemarks:  # Placemarks are lines or points
-                                    # Create new list to hold points for a line
-                                    nametag = pm.findall("sfn:name", ns)
-                                    for tag in nametag:
-                                        pmname = tag.text
-                                        #print("  Placemark: "+pmname)
-                                    point = pm.findall("sfn:Point", ns)
-                                    lstr = pm.findall("sfn:LineString", ns)
-                                    elpol = pm.findall("sfn:Polygon", ns)
-                                    descfind = pm.findall("sfn:description", ns)
-                                    if descfind:
-                                        desc = descfind[0].text.strip()
-                                        #print("   Description: "+desc)
-                                    else:
-                                        desc = ""
-                                    for pt in point:  # add any points to this folder
-                                        coords = pt.findall("sfn:coordinates", ns)
-                                        for coord in coords:  # Get the coords tag
-                                            cfields = coord.text.split(",")
-                                            lat = float(cfields[1])
-                                            lon = float(cfields[0])
-                                            # labels[aptname][subname].append([pmname,lat,lon])
-                                            newdiagrams[aptname].addlabel((pmname, lat, lon, desc), subname, category)
-                                            #print("   Point coords: "+coord.text)
-                                            # print(cfields)
-                                            # cstr = ddtodms()
-                                            # print(cstr)
-                                    for ls in lstr:  # Add any lines to this folder
-                                        coords = ls.findall("sfn:coordinates", ns)
-                                        for coord in coords:  # Get the coords tag
-                                            # get rid of the extra whitespace
-                                            # Split by spaces between coords
-                                            clist = []
-                                            cleancoords = coord.text.strip().split(' ')
-                                            for cleancoord in cleancoords:
-                                                # Coords are lon,lat,alt
-                                                # Split these out and convert to float
-                                                cfields = cleancoord.split(",")
-                                                if len(cfields) > 1:  # some lists are empty
-                                                    lat = float(cfields[1])
-                                                    lon = float(cfields[0])
-                                                    # apdlines[aptname][subname][apdi].append([lat,lon])
-                                                    clist.append((lat, lon))
-                                            newdiagrams[aptname].addline(pmname, clist, desc, subname, category)
-                                            # print("   Line coords: "+cleancoords)
-                                            # print("   Line coords:")
-                                            # print(cleancoords)
-                                    for poly in elpol:
-                                        #print("     "+poly.tag)
-                                        elobi = poly.findall("sfn:outerBoundaryIs", ns)
-                                        for bdry in elobi:
-                                            ellinrng = bdry.findall("sfn:LinearRing", ns)
-                                            for ring in ellinrng:
-                                                coords = ring.findall("sfn:coordinates", ns)
-                                                for coord in coords:  # Get the coords tag
-                                                    clist = []
-                                                    # get rid of the extra whitespace
-                                                    # Split by spaces between coords
-                                                    cleancoords = coord.text.strip().split(' ')
-                                                    for cleancoord in cleancoords:
-                                                        # Coords are lon,lat,alt
-                                                        # Split these out and convert to float
-                                                        cfields = cleancoord.split(",")
-                                                        if len(cfields) > 1:  # some lists are empty
-                                                            lat = float(cfields[1])
-                                                            lon = float(cfields[0])
-                                                            # apdlines[aptname][subname][apdi].append([lat,lon])
-                                                            clist.append((lat, lon))
-                                                    newdiagrams[aptname].addline(pmname, clist, desc, subname, category)
-                                                    # print("   Line coords: "+cleancoords)
-                                                    #print("   Line coords:")
-                                                    # print(cleancoords)
-                                    # move on to next list
-                                    apdi += 1
-
-                    # elif category == "Old Diagram Ref":
-                    #     oldref = cat.findall("sfn:Folder", ns)
-                    #     for folder in oldref:
-                    #         aptname = folder.findall("sfn:name", ns)
-                    #         for name in aptname:
-                    #             aptname = name.text
-                    #             print("Apt name: "+aptname)
-                    #         for apttags in folder:  # Subfolders in airport per color group
-                    #             # print(apttags.tag,apttags.text)
-                    #             nametag = apttags.findall("sfn:name", ns)
-                    #             for tag in nametag:
-                    #                 subname = tag.text
-                    #                 print(" Subfolder: "+subname)
-                    #                 placemarks = apttags.findall("sfn:Placemark", ns)
-                    #                 # keep track of which line we are on
-                    #                 # apdi = 0
-                    #                 for pm in placemarks:  # Placemarks are lines or points
-                    #                     # Create new list to hold points for a line
-                    #                     nametag = pm.findall("sfn:name", ns)
-                    #                     for tag in nametag:
-                    #                         pmname = tag.text
-                    #                         print("  Placemark: "+pmname)  # REF ONLY for lines
-                    #                     point = pm.findall("sfn:Point", ns)
-                    #                     lstr = pm.findall("sfn:LineString", ns)
-                    #                     for pt in point:  # add any points to this folder
-                    #                         coords = pt.findall("sfn:coordinates", ns)
-                    #                         for coord in coords:  # Get the coords tag
-                    #                             cfields = coord.text.split(",")
-                    #                             lat = float(cfields[1])
-                    #                             lon = float(cfields[0])
-                    #                             # oldlabels[aptname][subname].append([pmname,lat,lon])
-                    #                             newdiagrams[aptname].addreflabel((pmname, lat, lon), subname)
-                    #                             print("   Point coords: "+coord.text)
-                    #                             # print(cfields)
-                    #                             # cstr = ddtodms()
-                    #                             # print(cstr)
-                    #                     for ls in lstr:  # Add any linse to this folder
-                    #                         coords = ls.findall("sfn:coordinates", ns)
-                    #                         for coord in coords:  # Get the coords tag
-                    #                             # get rid of the extra whitespace
-                    #                             # Split by spaces between coords
-                    #                             cleancoords = coord.text.strip().split(' ')
-                    #                             # print(cleancoords)
-                    #                             clist = []
-                    #                             for cleancoord in cleancoords:
-                    #                                 # Coords are lon,lat,alt
-                    #                                 # Split these out and convert to float
-                    #                                 cfields = cleancoord.split(",")
-                    #                                 if len(cfields) > 1:  # some lists are empty
-                    #                                     lat = float(cfields[1])
-                    #                                     lon = float(cfields[0])
-                    #                                     # oldlines[aptname][subname][apdi].append([lat,lon])
-                    #                                     clist.append((lat, lon))
-                    #                             newdiagrams[aptname].addrefline(clist, subname)
-                    #                             # print("   Line coords: "+cleancoords)
-                    #                             print("   Line coords:")
-                    #                             # print(cleancoords)
-                    #                     # move on to next list
-                    #                     # apdi += 1
+    # Folder layout is:
+    # kml
+    #  Document
+    #   ZSE Airport Diagrams (main folder)
+    #    Current Diagrams, Old Diagram Ref, In Work (category)
+    #     Airport
+    #      Color group
+    #       Placemarks
+    # Depth of each of these, kml is 0
+    maindepth = 2
+    catdepth = 3
+    aptdepth = 4
+    colordepth = 5
+    pmdepth = 6
+    # The document is read as a stream so only the current placemark is held in memory
+    # Elements from the root down to the one being read
+    stack = []
+    # Names of the folders we're in, by depth
+    names = {}
+    # Number of placemarks in the stack, their contents are kept until they're read
+    inpm = 0
+    pmname = ""
+    for event, elem in etree.iterparse(kml, events=("start", "end")):
+        if event == "start":
+            # New element at this depth, forget names from the last one
+            for depth in [d for d in names if d >= len(stack)]:
+                del names[depth]
+            stack.append(elem)
+            if elem.tag == sfn+"Placemark":
+                inpm += 1
+            continue
+        stack.pop()
+        depth = len(stack)
+        tag = elem.tag
+        # Only look at things where the folder layout is what we expect
+        layout = (depth >= maindepth and all(stack[d].tag == sfn+"Folder" for d in range(maindepth, min(depth, colordepth))))
+        if tag == sfn+"name" and not inpm and layout and depth-1 in (catdepth, aptdepth, colordepth):
+            # Name of the folder we're in
+            names[depth-1] = elem.text
+            if depth-1 == catdepth:
+                print("Category: "+str(elem.text))
+            elif depth-1 == aptdepth and catdepth in names:
+                aptname = elem.text
+                print(" Apt name: "+aptname)
+                if aptname not in newdiagrams:
+                    newdiagrams[aptname] = newAirportDiag()
+        elif tag == sfn+"Placemark":
+            inpm -= 1
+            if depth == pmdepth and layout and all(d in names for d in (catdepth, aptdepth, colordepth)):
+                category = names[catdepth]
+                aptname = names[aptdepth]
+                subname = names[colordepth]
+                # Placemarks are lines or points
+                nametag = elem.findall("sfn:name", ns)
+                for tag in nametag:
+                    pmname = tag.text
+                    #print("  Placemark: "+pmname)
+                point = elem.findall("sfn:Point", ns)
+                lstr = elem.findall("sfn:LineString", ns)
+                elpol = elem.findall("sfn:Polygon", ns)
+                descfind = elem.findall("sfn:description", ns)
+                if descfind:
+                    desc = (descfind[0].text or "").strip()
+                    #print("   Description: "+desc)
+                else:
+                    desc = ""
+                for pt in point:  # add any points to this folder
+                    coords = pt.findall("sfn:coordinates", ns)
+                    for coord in coords:  # Get the coords tag
+                        cfields = coord.text.split(",")
+                        lat = float(cfields[1])
+                        lon = float(cfields[0])
+                        newdiagrams[aptname].addlabel((pmname, lat, lon, desc), subname, category)
+                for ls in lstr:  # Add any lines to this folder
+                    coords = ls.findall("sfn:coordinates", ns)
+                    for coord in coords:  # Get the coords tag
+                        clist = parsecoords(coord.text)
+                        newdiagrams[aptname].addline(pmname, clist, desc, subname, category)
+                for poly in elpol:
+                    for ring in poly.findall("sfn:outerBoundaryIs/sfn:LinearRing", ns):
+                        coords = ring.findall("sfn:coordinates", ns)
+                        for coord in coords:  # Get the coords tag
+                            clist = parsecoords(coord.text)
+                            newdiagrams[aptname].addline(pmname, clist, desc, subname, category)
+        if not inpm and stack:
+            # Done with this element, drop it so the tree doesn't build up
+            elem.clear()
+            stack[-1].remove(elem)
     print("")
     print("THE WHOLE ENCHILADA")
     for apt, dobj in newdiagrams.items():
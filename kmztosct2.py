@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 
-import sys
+import argparse
+import json
+import os
 from kmzfile import readkmz
 # import vrccolors
+import glyphs
 import sectorfile
+import sctcache
 from pathlib import Path
 
 # Sectorfiles to be updated
@@ -25,27 +29,175 @@ sectorfiles = [
     "ZSE-v3_05"
 ]
 
-# Location of the diagram kmz
-kmlfile = sys.argv[2]
-print("Will open: "+str(kmlfile))
-
 # Current airac cycle, part of filenames
 airac = "1903"
 
-# Modification version of current airac
-modver = sys.argv[3]
-
-# Where to look for the master file set
-masterdir = Path(sys.argv[1])
-newdiags = readkmz(masterdir / kmlfile)
-# print(newdiags["KSEA"].reflines)
-# Iterate over each sectorfile
-# Basic workflow is:
-#  Read current sector file and split into sections
-#  Prune out labels that will be replaced
-#  Write new file, inserting new content as required
-for sfile in sectorfiles:
+# Record of what the last build used, in the master directory
+# --incremental compares against this to skip sector files that wouldn't change
+manifestname = ".kmztosct2-manifest.json"
+
+# Diagrams shared with pool workers, set once per worker by initworker()
+newdiags = {}
+# Airports already rendered to sct2 lines, reused by every sector file that includes them
+rendered = {}
+
+
+def initworker(diags, options):
+    # Runs once in each worker process so the diagrams are only sent over once
+    global newdiags, rendered
+    newdiags = diags
+    rendered = {}
+    applyoptions(options)
+
+
+def applyoptions(options):
+    # Set up the settings that change the output, in this process
+    glyphs.setfont(options["font"])
+    sectorfile.sectorfileobj.circletolerance = options["circletolerance"]
+    sectorfile.sectorfileobj.simplify = options["simplify"]
+    sectorfile.sectorfileobj.mergetolerance = options["mergetolerance"]
+
+
+def simplifyarg(text):
+    # --simplify FEET or NAME=FEET, NAME being a color or category
+    name, sep, feet = text.rpartition("=")
+    try:
+        feet = float(feet)
+    except ValueError:
+        raise argparse.ArgumentTypeError("tolerance has to be a number of feet: "+text)
+    if feet < 0:
+        raise argparse.ArgumentTypeError("tolerance can't be negative: "+text)
+    return (name if sep else "*", feet)
+
+
+def buildsector(sfile, masterdir, modver, cache=None):
+    # Basic workflow is:
+    #  Read current sector file and split into sections
+    #  Prune out labels that will be replaced
+    #  Write new file, inserting new content as required
     print("Processing "+sfile)
-    sectorobj = sectorfile.sectorfileobj(sfile, masterdir, airac, modver)
-    sectorobj.addnewdiagrams(newdiags)
+    sectorobj = sectorfile.sectorfileobj(sfile, masterdir, airac, modver, cache)
+    sectorobj.addnewdiagrams(newdiags, rendered)
     sectorobj.write()
+    return sfile
+
+
+def loadmanifest(masterdir):
+    try:
+        with open(masterdir / manifestname, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def savemanifest(masterdir, manifest):
+    # Write to a temp name first so a failed write doesn't leave half a manifest
+    tmpfile = masterdir / (manifestname+".tmp")
+    with open(tmpfile, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmpfile, masterdir / manifestname)
+
+
+def stalesectors(masterdir, modver, manifest, digests, masters, options):
+    # Pick out the sector files that have to be rebuilt
+    # Anything built last time with the same masters, airports and options can be left alone
+    if (manifest.get("airac") != airac or manifest.get("modver") != modver
+            or manifest.get("options") != options):
+        return list(sectorfiles)
+    oldapts = manifest.get("airports", {})
+    oldmasters = manifest.get("masters", {})
+    stale = []
+    for sfile in sectorfiles:
+        if not (masterdir / (sfile+"_"+airac+modver+".sct2")).exists():
+            print(sfile+": no output file")
+        elif oldmasters.get(sfile) != masters[sfile]:
+            print(sfile+": master file changed")
+        else:
+            changed = [apt for apt in sectorfile.sectorfileobj.airportsfor(sfile[:3])
+                       if oldapts.get(apt) != digests.get(apt)]
+            if not changed:
+                print(sfile+": up to date")
+                continue
+            print(sfile+": changed "+", ".join(changed))
+        stale.append(sfile)
+    return stale
+
+
+def buildall(masterdir, modver, options, jobs=1, cache=None, sfiles=sectorfiles):
+    # Iterate over each sectorfile
+    if jobs > 1:
+        # Sectors are independent once the kmz is read, so farm them out
+        import multiprocessing
+        with multiprocessing.Pool(jobs, initworker, (newdiags, options)) as pool:
+            results = [pool.apply_async(buildsector, (sfile, masterdir, modver, cache)) for sfile in sfiles]
+            for result in results:
+                print("Finished "+result.get())
+    else:
+        for sfile in sfiles:
+            buildsector(sfile, masterdir, modver, cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update sector files with new airport diagrams from a kmz")
+    # Where to look for the master file set
+    parser.add_argument("masterdir", help="directory containing the master sector files")
+    # Location of the diagram kmz
+    parser.add_argument("kmlfile", help="diagram kmz, relative to the master directory")
+    # Modification version of current airac
+    parser.add_argument("modver", help="version appended to the new sector file names")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of sector files to build at once (0 for one per core)")
+    parser.add_argument("--cache-dir", help="where to cache parsed master files (default: .sctcache in the master directory)")
+    parser.add_argument("--no-cache", action="store_true", help="parse every master file from scratch")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="only rebuild sector files whose airports or master file changed since the last build")
+    parser.add_argument("--font", help="single stroke font for drawn labels (default: $"+glyphs.envvar+" or "+glyphs.defaultfont+")")
+    parser.add_argument("--circle-tolerance", type=float, default=sectorfile.sectorfileobj.circletolerance,
+                        help="most a drawn circle or arc can cut inside the true curve, in feet (default: %(default)s)")
+    parser.add_argument("--simplify", type=simplifyarg, action="append", default=[], metavar="[NAME=]FEET",
+                        help="drop line points that move the line less than FEET, for lines of color or category NAME, or all lines. Can be given more than once")
+    parser.add_argument("--merge-tolerance", type=float, default=sectorfile.sectorfileobj.mergetolerance,
+                        help="join segments that line up to within this many feet, 0 to only drop duplicates (default: %(default)s)")
+    args = parser.parse_args()
+    if args.circle_tolerance <= 0:
+        parser.error("--circle-tolerance has to be more than 0")
+    if args.merge_tolerance < 0:
+        parser.error("--merge-tolerance can't be negative")
+
+    print("Will open: "+str(args.kmlfile))
+    masterdir = Path(args.masterdir)
+    global newdiags
+    newdiags = readkmz(masterdir / args.kmlfile)
+    # print(newdiags["KSEA"].reflines)
+    if args.no_cache:
+        cache = None
+        hashfile = sctcache.filehash
+    else:
+        cache = sctcache.sctcache(args.cache_dir or masterdir / ".sctcache")
+        hashfile = cache.filehash
+    # Settings that change the output, a build with different ones starts over
+    options = {"font": str(glyphs.glyphcache(args.font).path),
+               "circletolerance": args.circle_tolerance,
+               "simplify": dict(args.simplify),
+               "mergetolerance": args.merge_tolerance}
+    applyoptions(options)
+    # What this build is made from
+    digests = {apt: diag.digest() for apt, diag in newdiags.items()}
+    masters = {sfile: hashfile(masterdir / (sfile+"_"+airac+".sct2")) for sfile in sectorfiles}
+    if args.incremental:
+        sfiles = stalesectors(masterdir, args.modver, loadmanifest(masterdir), digests, masters, options)
+    else:
+        sfiles = sectorfiles
+    jobs = args.jobs
+    if jobs < 1:
+        jobs = os.cpu_count() or 1
+    if sfiles:
+        buildall(masterdir, args.modver, options, min(jobs, len(sfiles)), cache, sfiles)
+    else:
+        print("Nothing to rebuild")
+    savemanifest(masterdir, {"airac": airac, "modver": args.modver, "options": options,
+                             "airports": digests, "masters": masters})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+# Clean-up passes on lines before they're written to the sector file
+# simplify drops points that don't change the shape by more than a tolerance
+# cleansegments drops repeated segments and joins ones that line up
+
+import math
+from array import array
+import geodesy
+
+# Feet in a nmi, nmi in a degree of latitude
+ftpernm = 6076
+nmperdeg = 60
+
+
+def simplify(packed, tolerance):
+    # Douglas-Peucker on a packed lat/lon array, tolerance in feet
+    # Keeps the ends and any point further than tolerance from the simplified line
+    # Gives back the same array if nothing can be dropped
+    count = len(packed)//2
+    if count < 3 or tolerance <= 0:
+        return packed
+    # Flat feet around the first point is plenty at airport sizes
+    lat0 = packed[0]
+    lon0 = packed[1]
+    fy = nmperdeg*ftpernm
+    fx = fy*math.cos(math.radians(lat0))
+    xs = [(lon-lon0)*fx for lon in packed[1::2]]
+    ys = [(lat-lat0)*fy for lat in packed[0::2]]
+    keep = bytearray(count)
+    keep[0] = keep[-1] = 1
+    tol2 = tolerance*tolerance
+    # Stretches of the line still to check, as first/last point
+    stack = [(0, count-1)]
+    while stack:
+        first, last = stack.pop()
+        ax = xs[first]
+        ay = ys[first]
+        dx = xs[last]-ax
+        dy = ys[last]-ay
+        seg2 = dx*dx+dy*dy
+        # Furthest point from the segment, if any are out of tolerance
+        far = -1
+        fardist = tol2
+        for i in range(first+1, last):
+            px = xs[i]-ax
+            py = ys[i]-ay
+            if seg2:
+                # Closest spot on the segment, not the whole line, so loops work too
+                t = (px*dx+py*dy)/seg2
+                t = 0 if t < 0 else 1 if t > 1 else t
+                px -= t*dx
+                py -= t*dy
+            dist = px*px+py*py
+            if dist > fardist:
+                far = i
+                fardist = dist
+        if far >= 0:
+            keep[far] = 1
+            stack.append((far, last))
+            stack.append((first, far))
+    if all(keep):
+        return packed
+    kept = array('d')
+    for i in range(count):
+        if keep[i]:
+            kept.append(packed[2*i])
+            kept.append(packed[2*i+1])
+    return kept
+
+
+def cleansegments(lines, tolerance):
+    # Tidy up rendered sct2 lines (" lat lon lat lon color")
+    # Drops zero length segments and ones already drawn, either way round, in the same color
+    # Joins a segment onto the one before it when they carry on in a straight line,
+    # as long as every point merged away is within tolerance feet of the result
+    # Anything that isn't a segment (comments) is left where it is
+    # Returns the new lines and how many were removed
+    segs = []
+    seen = set()
+    removed = 0
+    for line in lines:
+        elems = line.split()
+        if len(elems) != 5 or line[:1] == ";":
+            segs.append(line)
+            continue
+        start = elems[0]+" "+elems[1]
+        end = elems[2]+" "+elems[3]
+        color = elems[4]
+        key = (start, end, color) if start < end else (end, start, color)
+        if start == end or key in seen:
+            removed += 1
+            continue
+        seen.add(key)
+        segs.append((start, end, color))
+    if tolerance > 0:
+        segs, merged = mergesegments(segs, tolerance)
+        removed += merged
+    return [seg if isinstance(seg, str) else " "+seg[0]+" "+seg[1]+" "+seg[2] for seg in segs], removed
+
+
+def mergesegments(segs, tolerance):
+    # Join runs of segments that line up, see cleansegments
+    # Coordinates are decoded once each
+    tokens = []
+    for seg in segs:
+        if not isinstance(seg, str):
+            tokens.extend(seg[0].split())
+            tokens.extend(seg[1].split())
+    decimal, bad = geodesy.dmstoddbatch(tokens)
+    coords = {}
+    for i in range(0, len(tokens), 2):
+        coords[tokens[i]+" "+tokens[i+1]] = (decimal[i], decimal[i+1])
+    out = []
+    merged = 0
+    # Points merged away from the segment at the end of out
+    between = []
+    for seg in segs:
+        last = out[-1] if out else None
+        if (isinstance(seg, str) or isinstance(last, str) or last is None
+                or last[2] != seg[2] or last[1] != seg[0]):
+            out.append(seg)
+            between = []
+            continue
+        points = between + [coords[seg[0]]]
+        if offline(coords[last[0]], coords[seg[1]], points, tolerance):
+            out.append(seg)
+            between = []
+        else:
+            out[-1] = (last[0], seg[1], seg[2])
+            between = points
+            merged += 1
+    return out, merged
+
+
+def offline(start, end, points, tolerance):
+    # Whether any of points is more than tolerance feet from the segment start-end
+    # Bad coordinates never count as in line
+    fy = nmperdeg*ftpernm
+    fx = fy*math.cos(math.radians(start[0]))
+    dx = (end[1]-start[1])*fx
+    dy = (end[0]-start[0])*fy
+    seg2 = dx*dx+dy*dy
+    tol2 = tolerance*tolerance
+    for lat, lon in points:
+        px = (lon-start[1])*fx
+        py = (lat-start[0])*fy
+        if seg2:
+            t = (px*dx+py*dy)/seg2
+            t = 0 if t < 0 else 1 if t > 1 else t
+            px -= t*dx
+            py -= t*dy
+        if not px*px+py*py <= tol2:
+            return True
+    return False
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+# On-disk cache of parsed sector files
+# Entries are keyed by a hash of the file's contents, so a new AIRAC file
+# (or any edit) misses the cache and gets parsed again
+# Least recently used entries are removed once the cache is over its size cap
+# pickle, zlib and tempfile are only imported once an entry is read or written
+
+import hashlib
+import os
+from pathlib import Path
+
+
+class sctcache:
+    # Bump when the cached state changes shape so old entries are ignored
+    version = 2
+
+    def __init__(self, directory, maxsize=512 << 20):
+        self.directory = Path(directory)
+        # Cap on the total size of the cache in bytes
+        self.maxsize = maxsize
+        # Hashes already worked out this run, keyed by path
+        # Stat info is kept so an edited file gets hashed again
+        self.hashes = {}
+
+    def filehash(self, path):
+        # Hash the file contents
+        stat = os.stat(path)
+        statkey = (stat.st_size, stat.st_mtime_ns)
+        known = self.hashes.get(str(path))
+        if known is not None and known[0] == statkey:
+            return known[1]
+        digest = filehash(path)
+        self.hashes[str(path)] = (statkey, digest)
+        return digest
+
+    def entrypath(self, kind, path, salt=""):
+        # Name of the cache entry for this kind of data from this file
+        key = "%s:%i:%s:%s" % (kind, self.version, salt, self.filehash(path))
+        return self.directory / (kind+"-"+hashlib.sha1(key.encode()).hexdigest()+".cache")
+
+    def load(self, kind, path, salt=""):
+        # Get cached state for a file, or None if it hasn't been cached
+        import pickle
+        import zlib
+        entry = self.entrypath(kind, path, salt)
+        try:
+            with open(entry, 'rb') as f:
+                state = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError,
+                AttributeError, ImportError) as e:
+            # Attribute and import errors are entries naming classes that have since moved
+            print("Ignoring bad cache entry "+entry.name+": "+str(e))
+            try:
+                entry.unlink()
+            except OSError:
+                pass
+            return None
+        # Mark as recently used
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return state
+
+    def store(self, kind, path, state, salt=""):
+        # Save state for a file, then trim the cache back under its cap
+        import pickle
+        import tempfile
+        import zlib
+        entry = self.entrypath(kind, path, salt)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1)
+        # Write to a temp file and swap it in so other processes never see half an entry
+        fd, tmpname = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmpname, entry)
+        except OSError:
+            os.remove(tmpname)
+            raise
+        self.evict()
+
+    def evict(self):
+        # Remove least recently used entries until we're under the size cap
+        entries = []
+        total = 0
+        for entry in self.directory.glob("*.cache"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+        entries.sort()
+        for mtime, size, entry in entries:
+            if total <= self.maxsize:
+                break
+            try:
+                entry.unlink()
+            except OSError:
+                continue
+            total -= size
+
+
+def filehash(path):
+    # SHA-256 of a file's contents
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
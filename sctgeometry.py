@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+# SID lines and labels of a sector file, kept in spatialindex grids
+# so apd2kml can pull out any airport without going over the file again
+
+import re
+from array import array
+import geodesy
+import kmzfile
+import spatialindex
+
+
+class sctgeometry:
+    # Lines from the SID section and labels from a sector file, decoded once
+    # and indexed by location so nearby items can be pulled out for any airport
+    # Segments that join end to end with the same color are chained into one line
+    # Chains are looked up by their last point, labels by their position
+
+    def __init__(self, radius=3):
+        # Largest distance in nmi that can be asked about
+        self.radius = radius
+        # Points of every chain, packed as lat0, lon0, lat1, lon1...
+        self.coords = array('d')
+        # Where each chain's points start/end in coords, and its color
+        self.chainstart = array('I')
+        self.chainend = array('I')
+        self.chaincolor = []
+        # Each label as (name, (lat, lon), color)
+        self.labels = []
+        self.chaingrid = None
+        self.labelgrid = None
+
+    def addchain(self, coords, color):
+        self.chainstart.append(len(self.coords))
+        for lat, lon in coords:
+            self.coords.append(lat)
+            self.coords.append(lon)
+        self.chainend.append(len(self.coords))
+        self.chaincolor.append(color)
+
+    def chain(self, i):
+        # Points of a chain as a view into coords
+        return kmzfile.coordseq(self.coords, self.chainstart[i], self.chainend[i])
+
+    def lastpoint(self, i):
+        end = self.chainend[i]
+        return (self.coords[end-2], self.coords[end-1])
+
+    def build(self, index):
+        # Read the SID and LABELS sections out of an sctindex
+        self.readsid(index.lines('sid'))
+        self.readlabels(index.lines('labels'))
+        self.chaingrid = spatialindex.pointgrid([(i, self.lastpoint(i)) for i in range(len(self.chaincolor))], self.radius)
+        self.labelgrid = spatialindex.pointgrid([(i, label[1]) for i, label in enumerate(self.labels)], self.radius)
+        return self
+
+    def readsid(self, lines):
+        # Pick out the line segments first so all their coordinates can be converted at once
+        tokens = []
+        colors = []
+        for line in lines:
+            # See if line looks like a valid line
+            if re.search(r'^[ \t]+N\d{3}', line) is not None:
+                # Split it up to read the elements
+                elems = [i for i in line.split(';')[0].split(' ') if i != '']
+                if len(elems) > 4:
+                    tokens.extend(elems[:4])
+                    colors.append(elems[4])
+        # Get decimal degrees of coordinates
+        decimal, bad = geodesy.dmstoddbatch(tokens)
+        badsegs = set(i//4 for i in bad)
+        for i in sorted(badsegs):
+            print("Skipping line with bad coordinates: "+" ".join(tokens[4*i:4*i+4]))
+        # For remembering last coord to connect lines
+        lastcoord = ""
+        lastcolor = ""
+        # For storing a new line of coordinates
+        thislist = []
+        for i, color in enumerate(colors):
+            if i in badsegs:
+                continue
+            coord1 = (decimal[4*i], decimal[4*i+1])
+            coord2 = (decimal[4*i+2], decimal[4*i+3])
+            # See if it's a continuation of last line
+            if coord1 == lastcoord and color == lastcolor:
+                thislist.append(coord2)
+            # Test for the initial line, create a new list
+            elif lastcoord == "" and lastcolor == "":
+                thislist = [coord1, coord2]
+            else:
+                # Last line finished
+                # The one still going at the end of the section never gets here
+                self.addchain(thislist, lastcolor)
+                # Start a new list with these coordinates
+                thislist = [coord1, coord2]
+            # Remeber second coordinates/color for next time
+            lastcoord = coord2
+            lastcolor = color
+
+    def readlabels(self, lines):
+        labels = []
+        tokens = []
+        for line in lines:
+            if re.search('^".+" +[NS]', line) is not None:
+                lblpre = [i for i in line.split('"') if i]
+                postelems = [i for i in lblpre[1].split(';')[0].strip().split(' ') if i]
+                lblelems = ['"'+lblpre[0]+'"']
+                lblelems.extend(postelems)
+                if len(lblelems) > 3:
+                    labels.append(lblelems)
+                    tokens.extend(lblelems[1:3])
+        decimal, bad = geodesy.dmstoddbatch(tokens)
+        badlbls = set(i//2 for i in bad)
+        for i, lblelems in enumerate(labels):
+            if i in badlbls:
+                print("Skipping label with bad coordinates: "+" ".join(lblelems))
+                continue
+            lblcoords = (decimal[2*i], decimal[2*i+1])
+            self.labels.append((lblelems[0].split('"')[1], lblcoords, lblelems[3]))
+
+    def chainsnear(self, coords, radius=None):
+        # Numbers of the chains ending less than radius nmi from coords, in file order
+        return sorted(self.chaingrid.within(coords, radius))
+
+    def labelsnear(self, coords, radius=None):
+        # Labels less than radius nmi from coords, in file order
+        return [self.labels[i] for i in sorted(self.labelgrid.within(coords, radius))]
+
+
+def loadgeometry(index, cache=None, radius=3):
+    # Lines and labels of an indexed sector file, reusing them from an sctcache if the file hasn't changed
+    salt = "%s:%r" % (index.encoding, radius)
+    if cache is not None:
+        cached = cache.load("geometry", index.path, salt)
+        if cached is not None:
+            return cached
+    geometry = sctgeometry(radius).build(index)
+    if cache is not None:
+        cache.store("geometry", index.path, geometry, salt)
+    return geometry
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+# Byte offset index of a sct2 file
+# One pass over the file records where each [SECTION] and each SID/STAR
+# subsection sits, without tokenizing any of the lines
+# Readers can then seek to just the sections they need
+
+import os
+
+
+class sctindex:
+    # Standard sections recognized by VRC
+    # "header" is comment info at the top
+    stdsections = ["header", "colors", "info", "regions", "low airway",
+                   "high airway", "airport", "vor", "ndb", "runway",
+                   "fixes", "artcc", "labels", "sid", "star",
+                   "artcc high", "artcc low", "geo"]
+
+    # How much of the file to copy at a time
+    copychunk = 1 << 20
+
+    def __init__(self, path):
+        self.path = path
+        # Same encoding open() would use, since the file is read as bytes
+        import locale
+        self.encoding = locale.getpreferredencoding(False)
+        # [start, end, clean] byte ranges of each section
+        # Clean ranges are already written the way we'd write them (no trailing space)
+        self.spans = {key: [] for key in self.stdsections}
+        # Byte ranges of each SID/STAR subsection, by name
+        self.subspans = {"sid": {}, "star": {}}
+        # Subsection names in the order they appear
+        self.sidsubs = []
+        self.starsubs = []
+
+    def scan(self):
+        # Go through the file building the index
+        # Yields (section, line, header) for every line so a caller can parse as it goes
+        # header is set on the line that starts a section
+        kres = {}
+        for key in self.stdsections:
+            skey = "["+key.upper()+"]"
+            kres[key] = [skey, len(skey)]
+        # Track which section we're in
+        currsec = "header"
+        subsec = ''
+        # Byte offset of the current line
+        pos = 0
+        with open(self.path, 'rb') as f:
+            for raw in f:
+                start = pos
+                pos += len(raw)
+                text = raw.decode(self.encoding)
+                line = text.rstrip()
+                clean = text == line + os.linesep
+                header = False
+                # See if we've made it to the colors section
+                if line[:7] == "#define":
+                    currsec = "colors"
+                    header = True
+                # Otherwise we're in the thick of it, see if we're starting a new section
+                elif line[:1] == "[":
+                    for key in self.stdsections:
+                        # see if the line is [SECTION]
+                        if line[:kres[key][1]] == kres[key][0]:
+                            currsec = key
+                            header = True
+                            # If we just switched from SID to STAR, we need to blank this out until we get the next one
+                            subsec = ""
+                            break
+
+                # Break SID and STAR down into subsections
+                if currsec == "sid" or currsec == "star":
+                    # Search for the headers, start a new section
+                    ochar = line[:1]
+                    if ochar != " " and ochar != ";" and ochar != "\n":
+                        subsec = line[:26].strip()  # Get name of subsection
+                        if currsec == "sid":
+                            self.sidsubs.append(subsec)
+                        else:
+                            self.starsubs.append(subsec)
+                        self.subspans[currsec][subsec] = [start, pos, clean]
+                    elif subsec:  # if no new section but we are in one
+                        self.extendspan(self.subspans[currsec][subsec], start, pos, clean)
+                else:  # Any other random line
+                    subsec = ""  # Just in case
+                # Remember where this section is in the file
+                spans = self.spans[currsec]
+                if not spans or not self.extendspan(spans[-1], start, pos, clean):
+                    spans.append([start, pos, clean])
+                yield currsec, line, header
+
+    def build(self):
+        # Index the file without looking at the lines
+        for item in self.scan():
+            pass
+        return self
+
+    def extendspan(self, span, start, end, clean):
+        # Add a line to a span if it follows straight on from it
+        if span[1] != start:
+            return False
+        span[1] = end
+        span[2] = span[2] and clean
+        return True
+
+    def readspan(self, span):
+        # Read the lines in a span back out of the file
+        with open(self.path, 'rb') as f:
+            f.seek(span[0])
+            pos = span[0]
+            for raw in f:
+                if pos >= span[1]:
+                    break
+                pos += len(raw)
+                yield raw.decode(self.encoding).rstrip()
+
+    def lines(self, key):
+        # Lines of a whole section, including the [SECTION] line
+        for span in self.spans[key]:
+            yield from self.readspan(span)
+
+    def sublines(self, sec, name):
+        # Lines of a SID or STAR subsection, including its header
+        yield from self.readspan(self.subspans[sec][name])
+
+    def copyspan(self, src, dest, span):
+        # Copy a span of this file to dest, an open text file
+        # src is this file opened as binary
+        if span[2]:
+            # Already formatted the way we'd write it, copy the bytes in chunks
+            dest.flush()
+            src.seek(span[0])
+            remaining = span[1]-span[0]
+            while remaining > 0:
+                chunk = src.read(min(remaining, self.copychunk))
+                if not chunk:
+                    # File got shorter since it was indexed
+                    raise OSError("%s ended before byte %i" % (self.path, span[1]))
+                dest.buffer.write(chunk)
+                remaining -= len(chunk)
+        else:
+            for line in self.readspan(span):
+                dest.write(line+"\n")
+
+
+def loadindex(path, cache=None):
+    # Index a file, reusing the index from an sctcache if the file hasn't changed
+    index = sctindex(path)
+    if cache is not None:
+        cached = cache.load("index", path, index.encoding)
+        if cached is not None:
+            cached.path = path
+            return cached
+    index.build()
+    if cache is not None:
+        cache.store("index", path, index, index.encoding)
+    return index
@@ -1,8 +1,20 @@
 #!/usr/bin/env python
 
+import itertools
 import math
+import os
 import re
+from array import array
+import geodesy
+import glyphs
+import lineops
+import sctindex
+import spatialindex
 import vrccolors
+# Single point versions, used all over
+from geodesy import cosinedist, coordbrng, coordbrgdist
+# sct2 coordinate conversions, here too since everything used to get them from this module
+from geodesy import ddtodms, ddtodmsbatch, dmstodd, dmstoddbatch
 
 # Basic structure of sct2 file is as follows
 # All headers listed, some not used here:
@@ -74,15 +86,30 @@ class sectorfileobj:
 
     # Standard sections recognized by VRC
     # "header" is comment info at the top
-    stdsections = ["header", "colors", "info", "regions", "low airway",
-                   "high airway", "airport", "vor", "ndb", "runway",
-                   "fixes", "artcc", "labels", "sid", "star",
-                   "artcc high", "artcc low", "geo"]
+    stdsections = sctindex.sctindex.stdsections
 
-    # Get dictionary of colors
-    deccolors = vrccolors.getcolors()
+    # Sections kept in memory, the rest are copied from the master file on write
+    heldsections = ["info", "labels"]
 
-    def __init__(self, filename, directory, airac, modver=''):
+    # Most a circle or arc can be inside the true curve, in feet
+    # Sets how many segments they're drawn with
+    circletolerance = 2.0
+    # Fewest segments for a whole circle, however small
+    circlesegments = 8
+
+    # Simplification tolerances in feet, by color or category name
+    # "*" is used for anything not listed, nothing is simplified without a tolerance
+    simplify = {}
+
+    # Segments that line up are joined if no point moves more than this, in feet
+    # Duplicate segments are always dropped, 0 stops joining
+    mergetolerance = 0.25
+
+    # How far in feet drawn text can be from the exact spherical placement
+    # Characters are placed on a flat projection around their origin when that's within this
+    texttolerance = 1.0
+
+    def __init__(self, filename, directory, airac, modver='', cache=None):
         # Sector code is first 3 of file name
         self.sector = filename[:3]
         # Just the file name
@@ -102,122 +129,125 @@ class sectorfileobj:
         # Every ICAO key will correspond to coordinates from the AIRPORT section
         # This is used to exclude existing labels for airports that have new labels defined
         self.airportcoords = {}
-        # Keep track of which colors are used
-        # Only these will be added to the final file
-        self.usedcolors = []
+        # Keep track of which colors are used, color -> registry id
+        # Only these will be added to the final file, in the order they were first used
+        self.usedcolors = {}
         # Subsections so we can remember the order
         self.sidsubs = []
         self.starsubs = []
+        # SID subsections that are being changed, held in memory
         self.subsecs = {"sid": {}, "star": {}}
         self.re_coord = re.compile(r'^[NS]\d{3}')
-        self.re_deccolor = re.compile(r'^\d{,8}$')
+        # sctcache to reuse parsed master files from earlier runs
+        self.cache = cache
         self.sections = self.getsections()
 
     def initairports(self):
-        if self.sector == "ZSE":
+        return self.airportsfor(self.sector)
+
+    @classmethod
+    def airportsfor(cls, sector):
+        # Airports whose diagrams go in a sector's files
+        if sector == "ZSE":
             # ZSE will include everything
-            airports = [i for i in self.aptsectors]
+            airports = [i for i in cls.aptsectors]
         else:
             # Only pick out new airports in this sector
-            airports = [apt for apt, asector in self.aptsectors.items() if asector == self.sector]
+            airports = [apt for apt, asector in cls.aptsectors.items() if asector == sector]
         return airports
 
+    @property
+    def colors(self):
+        # Color names and their values, shared with anything else using colors
+        return vrccolors.getregistry()
+
     def usedcolor(self, color):
         # Add new color to list of used colors
-        if color in self.deccolors or self.re_deccolor.search(color) is not None:
+        cid = self.colors.id(color)
+        if cid is not None:
             if color not in self.usedcolors:
-                self.usedcolors.append(color)
+                self.usedcolors[color] = cid
         else:  # Warn if color is not defined
             print("Color not found: "+color)
             # for i in range(5):
             #     print(str(i)+": "+elems[i])
 
     def getsections(self):
+        # Reads file into sections, or loads them from the cache if this file was read before
+        masterpath = self.directory / self.masterfilename
+        self.index = sctindex.sctindex(masterpath)
+        if self.cache is not None:
+            state = self.cache.load("sector", masterpath, self.index.encoding)
+            if state is not None:
+                print("Using cached "+self.masterfilename)
+                return self.loadstate(state)
+        sections = self.parsesections()
+        if self.cache is not None:
+            self.cache.store("sector", masterpath, self.savestate(sections), self.index.encoding)
+        return sections
+
+    def savestate(self, sections):
+        # Everything getsections() works out, for the cache
+        # Take this before any new diagrams are added
+        return {"sections": sections, "index": self.index, "subsecs": self.subsecs,
+                "sidsubs": self.sidsubs, "starsubs": self.starsubs,
+                "airportcoords": self.airportcoords, "magvar": self.magvar,
+                "usedcolors": list(self.usedcolors)}
+
+    def loadstate(self, state):
+        # Restore what getsections() would have worked out
+        self.index = state["index"]
+        # The file may have been moved since it was cached
+        self.index.path = self.directory / self.masterfilename
+        self.subsecs = state["subsecs"]
+        self.sidsubs = state["sidsubs"]
+        self.starsubs = state["starsubs"]
+        self.airportcoords = state["airportcoords"]
+        self.magvar = state["magvar"]
+        # Ids are only good for this process, so colors are cached by name
+        self.usedcolors = {color: self.colors.id(color) for color in state["usedcolors"]}
+        self.aptsubi = self.sidsubs.index("(Airports)")
+        return state["sections"]
+
+    def parsesections(self):
         # Reads file into sections
-        # Start with laying out the sct2 sections
-        sections = {}
-        kres = {}
-        for key in self.stdsections:
-            sections[key] = []
-            skey = "["+key.upper()+"]"
-            kres[key] = [skey, len(skey)]
-        # Track which section we're in
-        currsec = "header"
-        subsec = ''
-        secfilepath = self.directory / self.masterfilename
+        # Only the sections in heldsections are kept in memory
+        # The index remembers where everything else is in the master file,
+        # so write() can copy it straight across
+        sections = {key: [] for key in self.heldsections}
+        airportlines = []
         infosec = 0
-        # Open sector file and iterate through the lines
-        with open(secfilepath, 'r') as f:
-            for line in f:
-                line = line.rstrip()
-                # Build the airport coordinates dictionary
-                # This is used to exclude labels around airports with new ones
-                if currsec == "airport":  # do this first so we skip the header line
-                    # WY67 000.000 N041.47.21.809 W110.32.30.609
-                    # Split by spaces, remove blanks/newline
-                    elems = [i for i in line.split(' ') if i]
-                    # length 0 for empty line, 1 for next header
-                    # Could test only for >3 but would like to investigate if it's in between
-                    if len(elems) > 1:
-                        # Convert to decimal degrees
-                        # Add airport and coords to dict
-                        self.airportcoords[elems[0]] = dmstodd([elems[2], elems[3]])
-                # Add colors to used colors list
-                # Start with regions section as it's unique
-                elif currsec == "regions":
-                    if self.re_coord.search(line) is None:
-                        elems = [i for i in line.split(';')[0].split(' ') if i]
-                        if len(elems) > 2:
-                            self.usedcolor(elems[0].lower())
-                elif currsec == "info":
-                    infosec += 1
-                    if infosec == 8:
-                        self.magvar = float(line)
-                        print("Magvar: "+str(self.magvar))
-                # Handle other sections
-                else:
+        for currsec, line, header in self.index.scan():
+            if currsec in sections:
+                sections[currsec].append(line)
+            if header:
+                continue
+            # Build the airport coordinates dictionary
+            # This is used to exclude labels around airports with new ones
+            if currsec == "airport":
+                airportlines.append(line)
+            # Add colors to used colors list
+            # Start with regions section as it's unique
+            elif currsec == "regions":
+                if self.re_coord.search(line) is None:
                     elems = [i for i in line.split(';')[0].split(' ') if i]
-                    # Add colors to used colors list
-                    if len(elems) > 4 and self.re_coord.search(elems[0]) is not None:
-                        self.usedcolor(elems[4].lower())
-
-                # See if we've made it to the colors section
-                # These colors aren't used right now as they're applied from the main list as used
-                if line[:7] == "#define":
-                    currsec = "colors"
-                    # elems=[i for i in line.split(' ') if i]
-                    # print(elems)
-                # Otherwise we're in the thick of it, see if we're starting a new section
-                elif currsec != "headers" and line[:1] == "[":
-                    for key in sections.keys():
-                        # see if the line is [SECTION]
-                        if line[:kres[key][1]] == kres[key][0]:
-                            currsec = key
-                            # print("Entered section: "+key)
-                            # If we just switched from SID to STAR, we need to blank this out until we get the next one
-                            subsec = ""
-                            break
-
-                # Break SID and STAR down into subsections
-                # We only really care about certain ones though
-                if currsec in ["sid", "star"]:
-                    # Search for the headers, start a new section
-                    ochar = line[:1]
-                    if ochar != " " and ochar != ";" and ochar != "\n":
-                        subsec = line[:26].strip()  # Get name of subsection
-                        if currsec == "sid":
-                            self.sidsubs.append(subsec)
-                        elif currsec == "star":
-                            self.starsubs.append(subsec)
-                        # print("New subsec: "+subsec)
-                        self.subsecs[currsec][subsec] = [line]  # Add the header line to it
-                    elif subsec:  # if no new section but we are in one
-                        # print("Adding to "+currsec+" -> "+subsec)
-                        self.subsecs[currsec][subsec].append(line)
-                    sections[currsec].append(line)  # write to the main list too
-                else:  # Any other random line
-                    subsec = ""  # Just in case
-                    sections[currsec].append(line)
+                    if len(elems) > 2:
+                        self.usedcolor(elems[0].lower())
+            elif currsec == "info":
+                infosec += 1
+                if infosec == 8:
+                    self.magvar = float(line)
+                    print("Magvar: "+str(self.magvar))
+            # Handle other sections
+            else:
+                elems = [i for i in line.split(';')[0].split(' ') if i]
+                # Add colors to used colors list
+                if len(elems) > 4 and self.re_coord.search(elems[0]) is not None:
+                    self.usedcolor(elems[4].lower())
+        self.airportcoords = airportcoords(airportlines)
+        # Subsections so we can remember the order
+        self.sidsubs = list(self.index.sidsubs)
+        self.starsubs = list(self.index.starsubs)
 
         # Index of Airports section in the list of SID subsections
         self.aptsubi = self.sidsubs.index("(Airports)")
@@ -229,7 +259,12 @@ class sectorfileobj:
         # Section for new diagrams
         # TODO: truncate to max length
         sectionname = "("+name+")"
-        if sectionname not in self.subsecs["sid"]:
+        if sectionname in self.subsecs["sid"]:
+            return
+        if sectionname in self.index.subspans["sid"]:
+            # Already in the master file, bring it in so we can add to it
+            self.subsecs["sid"][sectionname] = list(self.index.sublines("sid", sectionname))
+        else:
             print("  Adding subsec: "+name)
             # VRC wants this at the end of header lines
             fakecoords = "N000.00.00.000 E000.00.00.000 N000.00.00.000 E000.00.00.000\n"
@@ -245,21 +280,12 @@ class sectorfileobj:
     def coordlisttolines(self, coordlist, color):
         # Convert a list of coordinates to lines
         # Each lines starts with end point of previous line
-        # Keep last coord to tie lines together
-        # print("New coords list")
-        lastcoord = ""
-        for coord in coordlist:
-            # Get DMS of these coordinates
-            thiscoord = ddtodms(coord[0], coord[1])
-            # Skip first point so we can get next one too
-            if lastcoord:
-                if color in self.deccolors.keys():
-                    line = " %s %s %s" % (lastcoord, thiscoord, color)
-                    yield line
-                    # print(line)
-                else:
-                    print("  Color not found: "+color)
-            lastcoord = thiscoord
+        if not self.colors.isnamed(color):
+            if len(coordlist) > 1:
+                print("  Color not found: "+color)
+            return []
+        # Convert the whole list at once, then pair up neighbours
+        return segmentlines(ddtodmsbatch(packcoords(coordlist)), color)
 
     def dashline(self, coords, color, dashlen):
         # Assume we just get two coords for now
@@ -276,43 +302,44 @@ class sectorfileobj:
             lastcoord = coordbrgdist(coords[0], brng, deficit/2)
         else:
             lastcoord = coords[0]
-        for i in range(dashes):
-            nextcoord = coordbrgdist(lastcoord, brng, dashlen)
-            # print(nextcoord)
-            if i % 2 == 0:
-                lastdms = ddtodms(lastcoord[0], lastcoord[1])
-                nextdms = ddtodms(nextcoord[0], nextcoord[1])
-                line = " %s %s %s" % (lastdms, nextdms, color)
-                yield line
-            lastcoord = nextcoord
+        # Ends of each dash and gap, all measured along the line from the first one
+        points = array('d', lastcoord)
+        points.extend(geodesy.destination(lastcoord, brng, [dashlen*i for i in range(1, dashes+1)]))
+        dms = ddtodmsbatch(points)
+        # Every other one is a dash
+        return [" %s %s %s" % (dms[i], dms[i+1], color) for i in range(0, dashes, 2)]
 
     def drawcircle(self, coords, color):
         # Draws circle with center at first point, radius of length
         center = coords[0]
         radius = cosinedist(coords[0], coords[1])
-        segments = 18
-        increment = int(360/segments)
-        lastcoord = coordbrgdist(center, 0, radius)
-        for i in range(increment, 360+increment, increment):
-            # print("Projecting %i deg at %.2f nmi" % (i, radius))
-            nextcoord = coordbrgdist(center, math.radians(i), radius)
-            lastdms = ddtodms(lastcoord[0], lastcoord[1])
-            nextdms = ddtodms(nextcoord[0], nextcoord[1])
-            line = " %s %s %s" % (lastdms, nextdms, color)
-            yield line
-            lastcoord = nextcoord
+        return self.drawarc(center, radius, 0, 2*math.pi, color)
+
+    def drawarc(self, center, radius, start, sweep, color):
+        # Draws an arc around center, from bearing start clockwise through sweep (radians)
+        segments = self.arcsegments(radius, sweep)
+        # Project every point around the arc at once
+        sins, coss = geodesy.unitarc(start, sweep, segments)
+        points = geodesy.destinationtrig(center, sins, coss, radius)
+        return segmentlines(ddtodmsbatch(points), color)
+
+    def arcsegments(self, radius, sweep):
+        # Number of segments so no chord is further than circletolerance from the curve
+        # A chord spanning angle a is radius*(1-cos(a/2)) inside the curve at its middle
+        tolerance = self.circletolerance/6076
+        if radius > tolerance:
+            segments = math.ceil(sweep/(2*math.acos(1-tolerance/radius)))
+        else:
+            # Smaller than the tolerance, any segments will do
+            segments = 1
+        # Don't let a whole circle get any simpler than circlesegments
+        return max(segments, math.ceil(self.circlesegments*sweep/(2*math.pi)), 1)
 
     def drawstring(self, coords, name, color, scale, magvec):
         # Draws out text in "name" using lines, aligned to magnetic vector magvec
-        import freetype
-
-        # Load the font face to use
-        # Excellent single stroke - machtgth.ttf
-        #face = freetype.Face('/usr/share/fonts/TTF/DejaVuSans.ttf')
-        closed = 0
+        # Character outlines come from the glyph cache, so the font is only read once
+        font = glyphs.getfont()
         defspace = scale/150
-        flags = freetype.FT_LOAD_DEFAULT | freetype.FT_LOAD_NO_BITMAP
-        face.set_char_size( 16*90 )
         #height = 5
         #print("Magvec: "+str(magvec))
         vector = -magvec + 90 + self.magvar
@@ -320,79 +347,55 @@ class sectorfileobj:
         # Draw each character
         i=0
         # print("   Printing: "+name)
-        # if len(name)>3:
-        #     print("   Printing: "+name)
-        #     pc = 1
-        # else:
-        #     pc = 0
+        # Rotation to line the text up with the vector
+        vrad = math.radians(vector)
+        cosv = math.cos(vrad)
+        sinv = math.sin(vrad)
         for c in name:
             if c != " ":
-                # if pc:
-                #     print("    Printing: "+c)
                 # print("    Printing: "+c)
-                # Track the max and min to determine character witdth
-                maxlen = -200
-                minlen = 200
-                face.load_char(c, flags)
-                slot = face.glyph
-                outline = slot.outline
-                start = 0
-                # print(outline.contours)
-                # print(outline.points)
+                contours, width, advance, far = font.glyph(c)
+                # Font points are scaled to 1 unit height, divide by 60 to make them 1 minute lat tall
+                # Then multiply by scale to set height in Nm
+                s = scale/60
+                # Flat projection around this character's origin
+                # Offsets are rotated in nmi east/north, then turned back to degrees
+                # Lat and lon degrees differ by the cosine of the latitude
+                coslat = math.cos(math.radians(coords[0]))
+                # Font (x, y) -> lat/lon offset
+                latx = s*sinv*coslat
+                laty = s*cosv
+                lonx = s*cosv
+                lony = -s*sinv/coslat
+                flat = True
+                if far is not None:
+                    # Check the furthest point against the exact placement
+                    # Further out is where the flat projection is furthest off
+                    exact = rotateoffset(coords, [(coords[0]+far[1]*s, coords[1]+far[0]*s)], vector)
+                    errlat = coords[0]+far[0]*latx+far[1]*laty - exact[0]
+                    errlon = (coords[1]+far[0]*lonx+far[1]*lony - exact[1])*coslat
+                    flat = math.hypot(errlat, errlon)*60*6076.12 <= self.texttolerance
                 # Loop through the points to draw lines
-                for end in outline.contours:
-                    lastcoord = ""
-                    path = outline.points[start:end+1]
-                    if outline.tags[end] == 0 or closed:
-                        # print("Looping")
-                        path.append(path[0])
-                    #path.append(path[0])
-                    for pair in path:
-                        #latp, lonp = self.rotatepoint((pair[1]/10000, pair[0]/10000), self.magvar/2)
-                        # Convert font coordinates to lat/lon
-                        # Font points are scaled to 1000 height, divide by this to make them 1 degree lat tall
-                        # Then multiply by height/60 to set height in Nm
-                        newcoords = (coords[0]+pair[1]*scale/60000, coords[1]+pair[0]*scale/60000)
-                        # Get distance from origin to this point
-                        # print("     From: "+str(coords)+"   To: "+str(newcoords))
-                        if coords != newcoords:
-                            dist = cosinedist(coords, newcoords)
-                        else:
-                            dist = 0
-                        #print(pair[1]/pair[0])
-                        #brg = math.pi/2 - math.atan(pair[1]/pair[0]) - math.radians(self.magvar)
-                        # Get bearing from origin to this point
-                        # Correct this for magnetic variation
-                        brg = math.radians(coordbrng(coords, newcoords) - vector)
-                        # Project the new point accounting for the magnetic variation
-                        lat, lon = coordbrgdist(coords, brg, dist)
-                        #print(coords)
-                        #print(dist)
-                        #print(math.degrees(brg))
-                        #print(lat)
-                        #print(lon)
-                        #lat = coords[0]+latp
-                        #lon = coords[1]+lonp
-                        # Track the width of the character
-                        if newcoords[1] > maxlen:
-                            maxlen = newcoords[1]
-                        if newcoords[1] < minlen:
-                            minlen = newcoords[1]
-                        # Convert this coordinate for printing
-                        thiscoord = ddtodms(lat, lon)
-                        if lastcoord:
-                            line = " %s %s %s" % (lastcoord, thiscoord, color)
-                            # print(line)
-                            yield line
-                        lastcoord = thiscoord
-                    start = end+1
-                space = maxlen-minlen if maxlen-minlen > defspace else defspace
+                for path in contours:
+                    if flat:
+                        # All the points in one go
+                        lat0, lon0 = coords
+                        packed = array('d', bytes(16*len(path)))
+                        packed[0::2] = array('d', [lat0+x*latx+y*laty for x, y in path])
+                        packed[1::2] = array('d', [lon0+x*lonx+y*lony for x, y in path])
+                    else:
+                        # Too big to treat as flat, work out the points on the sphere
+                        # Convert font coordinates to lat/lon, then rotate around the origin
+                        packed = rotateoffset(coords, [(coords[0]+pair[1]*s, coords[1]+pair[0]*s) for pair in path], vector)
+                    # Convert these coordinates for printing
+                    yield from segmentlines(ddtodmsbatch(packed), color)
+                # Width of the character
+                space = width*scale/60 if width*scale/60 > defspace else defspace
             else:
                 space = defspace
             i+=1
             if i<len(name):
                 #print("Spacing over by "+str(space))
-                #latp, lonp = self.rotatepoint((0,1.1*(maxlen-minlen)), self.magvar/2)
                 # Project origin for next character
                 dist = cosinedist(coords, (coords[0], coords[1]+1.4*space))
                 latp, lonp = coordbrgdist(coords, math.pi/2 - math.radians(vector), dist)
@@ -406,106 +409,144 @@ class sectorfileobj:
         lon = coords[1] * math.cos(angle) - coords[0] * math.sin(angle)
         return lat, lon
 
-    def addnewdiagrams(self, newlayouts):
+    def renderdiagram(self, apt, diag):
+        # Turn an airport's new diagram into finished sct2 lines
+        # Nothing in here depends on the sector file except magvar,
+        # so the result can be reused by every file that has this airport
+        print("Rendering diagrams for: "+apt)
+        # Lines and labels for each category, in the order they were read
+        cats = {}
+        # Colors in the order they were first used
+        colors = []
+        # Stroked taxiway/runway labels
+        twylabels = []
+        # Points before and after simplifying
+        simplified = [0, 0]
+        # Lines taken out as duplicates or joined to others
+        removed = 0
+        for cat, objs in diag.cats.items():
+            print(" Processing cat: "+cat)
+            newlines = []
+            newlabels = []
+            if objs['lines']:
+                # Comment as heading for this airport's stuff
+                newlines.append(";"+apt)
+                # print(";"+airport)
+                for color, linelist in objs['lines'].items():
+                    # print("COLOR: "+color)
+                    if color not in colors:
+                        colors.append(color)
+                    for linestring in linelist:
+                        nameelem = linestring[0].split('_')
+                        name = nameelem[0]
+                        coords = linestring[1]
+                        desc = linestring[2]
+                        if name == "dashed":
+                            # We'll assume this color is already used...
+                            if len(nameelem) > 1:
+                                dashlen = int(nameelem[1])/6076
+                                # print("Setting custom dash length: "+nameelem[1])
+                            else:
+                                dashlen = 60/6076
+                            newlines.extend(self.dashline(coords, color, dashlen))
+                        elif name == "circle":
+                            newlines.extend(self.drawcircle(coords, color))
+                        elif name == "arc" and len(nameelem) > 2:
+                            # arc_<start>_<end>, true bearings, drawn clockwise from start to end
+                            # Center is the first point, radius is out to the second
+                            try:
+                                start = float(nameelem[1]) % 360
+                                sweep = (float(nameelem[2]) - start) % 360 or 360
+                            except ValueError:
+                                print("  Bad arc bearings at "+apt+": "+linestring[0])
+                                newlines.extend(self.coordlisttolines(coords, color))
+                            else:
+                                radius = cosinedist(coords[0], coords[1])
+                                newlines.extend(self.drawarc(coords[0], radius, math.radians(start), math.radians(sweep), color))
+                        else:
+                            if desc == "plot=True":
+                                scale = cosinedist(coords[0], coords[1])
+                                vert = coordbrng(coords[0], coords[1]) + self.magvar
+                                print("Vert brg: "+str(vert))
+                                newlines.extend(self.drawstring((coords[0][0], coords[0][1]), name, color, scale, vert+90))
+                            else:
+                                tolerance = self.simplifytolerance(color, cat)
+                                if tolerance:
+                                    # Drop points that don't change the shape
+                                    packed = packcoords(coords)
+                                    coords = lineops.simplify(packed, tolerance)
+                                    simplified[0] += len(packed)//2
+                                    simplified[1] += len(coords)//2
+                                newlines.extend(self.coordlisttolines(coords, color))
+            if objs['labels']:
+                # Comment as heading for this airport's stuff
+                newlabels.append(";"+apt)
+                # print(";"+airport)
+                for color, lbls in objs['labels'].items():
+                    # print(color)
+                    if color not in colors:
+                        colors.append(color)
+                    for point in lbls:
+                        if self.colors.isnamed(color):
+                            # print(point)
+                            if point[3] == "plot=True":
+                                # Stroked labels go in with this category's lines
+                                newlines.extend(self.drawstring((point[1], point[2]), point[0], color, 5, 90))
+                            else:
+                                cstr = ddtodms(point[1], point[2])
+                                newlabels.append('"'+point[0]+'" '+cstr+" "+color)
+                                if color == "twyrwy_labels":
+                                    twylabels.extend(self.drawstring((point[1], point[2]), point[0], color, .04, 90))
+                            # print(' "'+point[0]+'" '+cstr)
+                        else:
+                            print("  Color not found at "+apt+": "+color)
+            # Each category is its own subsection, so tidy them up separately
+            newlines, catremoved = lineops.cleansegments(newlines, self.mergetolerance)
+            removed += catremoved
+            cats[cat] = {'lines': newlines, 'labels': newlabels}
+        if simplified[0]:
+            print(" Simplified lines: dropped %i of %i points" % (simplified[0]-simplified[1], simplified[0]))
+        if removed:
+            print(" Removed %i duplicate or joined lines" % removed)
+        return {'cats': cats, 'colors': colors, 'twylabels': twylabels}
+
+    def simplifytolerance(self, color, cat):
+        # Simplification tolerance for lines of this color in this category
+        for key in (color, cat, "*"):
+            if key in self.simplify:
+                return self.simplify[key]
+        return 0
+
+    def addnewdiagrams(self, newlayouts, rendered=None):
+        # Diagrams already rendered, keyed by airport and magvar
+        # Pass the same dict for each sector file to only render an airport once
+        if rendered is None:
+            rendered = {}
         # List of airports with new labels
         # Old labels will be pruned out there
         newaptlbls = []
         # New section content with labels
         newlabels = []
-        twylabels = []
-        # New section content with new diagram lines
-        # newlines = []
-        # New section content with old diagram reference lines
-        # newreflines = []
-        # print(newlayouts)
         # Loop through each airport in this sector
         for apt, diag in {apt: diag for apt, diag in newlayouts.items() if apt in self.airports}.items():
+            # Text is rotated by magvar, so only reuse renders that match
+            key = (apt, self.magvar)
+            if key not in rendered:
+                rendered[key] = self.renderdiagram(apt, diag)
             print("Adding new diagrams for: "+apt)
-
-            for cat, objs in diag.cats.items():
-                print(" Processing cat: "+cat)
+            aptrender = rendered[key]
+            for cat, content in aptrender['cats'].items():
                 self.addsubsec(cat)
-                if objs['lines']:
-                    newlines = []
-                    # Comment as heading for this airport's stuff
-                    newlines.append(";"+apt)
-                    # print(";"+airport)
-                    for color, linelist in objs['lines'].items():
-                        # print("COLOR: "+color)
-                        if color not in self.usedcolors:
-                            self.usedcolors.append(color)
-                        for linestring in linelist:
-                            nameelem = linestring[0].split('_')
-                            name = nameelem[0]
-                            coords = linestring[1]
-                            desc = linestring[2]
-                            if name == "dashed":
-                                # We'll assume this color is already used...
-                                if len(nameelem) > 1:
-                                    dashlen = int(nameelem[1])/6076
-                                    # print("Setting custom dash length: "+nameelem[1])
-                                else:
-                                    dashlen = 60/6076
-                                for line in self.dashline(coords, color, dashlen):
-                                    newlines.append(line)
-                            elif name == "circle":
-                                for line in self.drawcircle(coords, color):
-                                    newlines.append(line)
-                            else:
-                                if desc == "plot=True":
-                                    scale = cosinedist(coords[0], coords[1])
-                                    vert = coordbrng(coords[0], coords[1]) + self.magvar
-                                    print("Vert brg: "+str(vert))
-                                    for line in self.drawstring((coords[0][0], coords[0][1]), name, color, scale, vert+90):
-                                        newlines.append(line)
-                                else:
-                                    for line in self.coordlisttolines(coords, color):
-                                        newlines.append(line)
-                    self.subsecs["sid"]["("+cat+")"].extend(newlines)
-                if objs['labels']:
+                if content['lines']:
+                    self.subsecs["sid"]["("+cat+")"].extend(content['lines'])
+                if content['labels']:
                     # Add this to list of airports with new labels
                     newaptlbls.append(apt)
-                    # Comment as heading for this airport's stuff
-                    newlabels.append(";"+apt)
-                    # print(";"+airport)
-                    for color, lbls in objs['labels'].items():
-                        # print(color)
-                        if color not in self.usedcolors:
-                            self.usedcolors.append(color)
-                        for point in lbls:
-                            if color in self.deccolors.keys():
-                                # print(point)
-                                if point[3] == "plot=True":
-                                    for line in self.drawstring((point[1], point[2]), point[0], color, 5, 90):
-                                        newlines.append(line)
-                                else:
-                                    cstr = ddtodms(point[1], point[2])
-                                    newlabels.append('"'+point[0]+'" '+cstr+" "+color)
-                                    if color == "twyrwy_labels":
-                                        for line in self.drawstring((point[1], point[2]), point[0], color, .04, 90):
-                                            twylabels.append(line)
-                                # print(' "'+point[0]+'" '+cstr)
-                            else:
-                                print("  Color not found at "+apt+": "+color)
+                    newlabels.extend(content['labels'])
+            for color in aptrender['colors']:
+                self.usedcolor(color)
             self.addsubsec("Taxiways")
-            self.subsecs["sid"]["(Taxiways)"].extend(twylabels)
-            # if diag.reflines:
-            #     # Comment as heading for this airport's stuff
-            #     newreflines.append(";"+apt+" - REF")
-            #     # print("Adding ref lines for: "+apt)
-            #     # print(";"+airport)
-            #     for color, coords in diag.reflines.items():
-            #         if color not in self.usedcolors:
-            #             self.usedcolors.append(color)
-            #         # print("COLOR: "+color)
-            #         for coordlist in coords:
-            #             for line in self.coordlisttolines(coordlist, color):
-            #                 newreflines.append(line)
-            # else:
-                # print("No ref lines for: "+apt)
-        # Add the new content to applicable sections
-        # self.subsecs["sid"]["(Current Diagrams)"].extend(newlines)
-        # self.subsecs["sid"]["(Old Diagram REF)"].extend(newreflines)
+            self.subsecs["sid"]["(Taxiways)"].extend(aptrender['twylabels'])
         # First remove labels where we have new ones
         self.prunelabels(newaptlbls)
         # Add new labels to remaining ones
@@ -523,12 +564,14 @@ class sectorfileobj:
         #   print("  Will prune for %s: %f,%f" % (newapt, coords[0], coords[1]))
         # Actually prune all labels lines
         re_lbl = re.compile('^".+" +[NS]')
+        # Split up the labels first so all the coordinates can be converted at once
+        allelems = []
+        tokens = []
         for line in self.sections["labels"]:
             # reicao=re.search("^;.+K[A-Z0-9]{3}",line)
             # if reicao is not None:
             #   print("Found airport labels for: "+line)
             # See if line looks like a label
-            prune = 0
             lblelems = []
             if re_lbl.search(line) is not None:
                 # print("Found label: "+line)
@@ -539,29 +582,36 @@ class sectorfileobj:
                 # print(postelems)
                 lblelems = ['"'+lblpre[0]+'"']
                 lblelems.extend(postelems)
-                # Convert coords to decimal
-                # print(lblelems)
                 if len(lblelems) > 2:
-                    lblcoords = dmstodd((lblelems[1], lblelems[2]))
-                    # Check against new airports
-                    for newapt in newlabels:
-                        # Calculate distance of label from airport
-                        dist = cosinedist(self.airportcoords[newapt], lblcoords)
-                        # Prune if distance less than theshold
-                        # 3 seems to just exclude our closest cases while accounding for large fields
-                        # Could possibly be smaller
-                        # Another way to do this would be to draw exclusion zones around each airport like X-Plane does
-                        if dist < 3:
-                            # print("Pruning line for "+newapt+": "+line)
-                            prune = 1
-                            break
-                        # if dist<8:
-                            # print(dist)
-                    # if prune:
-                        # print("Pruning for "+newapt+":"+line)
-                # else:
-                #     print("Bad elements: "+str(lblelems))
-                # elems=[i for i in line.strip().split(' ') if i!='']
+                    tokens.append(lblelems[1])
+                    tokens.append(lblelems[2])
+            allelems.append(lblelems)
+        # Convert coords to decimal
+        decimal, bad = dmstoddbatch(tokens)
+        # Grid of the new airports so each label only checks the ones near it
+        # 3 seems to just exclude our closest cases while accounding for large fields
+        # Could possibly be smaller
+        # Another way to do this would be to draw exclusion zones around each airport like X-Plane does
+        aptlocs = []
+        for newapt in newlabels:
+            if newapt in self.airportcoords:
+                aptlocs.append((newapt, self.airportcoords[newapt]))
+            else:
+                print("  No coordinates for airport "+newapt+", keeping its old labels")
+        newapts = spatialindex.pointgrid(aptlocs, 3)
+        for i in bad:
+            print("  Bad label coordinates, keeping it: "+tokens[i])
+        ci = 0
+        for line, lblelems in zip(self.sections["labels"], allelems):
+            prune = 0
+            if len(lblelems) > 2:
+                lat = decimal[ci]
+                lon = decimal[ci+1]
+                ci += 2
+                # Prune if near a new airport, unless the coordinates didn't make sense (NaN)
+                if lat == lat and lon == lon and newapts.anywithin((lat, lon)):
+                    # print("Pruning line: "+line)
+                    prune = 1
             if not prune:
                 keptlines.append(line)  # Keep anything not pruned
                 if len(lblelems) > 3:
@@ -573,122 +623,107 @@ class sectorfileobj:
         print("Writing new file...")
         newfile = self.directory / self.filename
         # Build new sector file
-        with open(newfile, "w") as newsct:
-            # Write each section
-            for key, contents in self.sections.items():
-                # Handle special cases first
-                if key == "info":
-                    contents[1] = contents[1]+self.modver
-                if key == "colors":
-                    # print("Writing: "+key)
-                    # Write existing colors
-                    # newsct.write(contents)
-                    # Write new colors
-                    # for name,deccolor in deccolors.items():
-                    #    newsct.write("#define "+name+" "+str(deccolor)+"\n")
-                    for color in self.usedcolors:
-                        if re.search(r'^\d{,8}$', color) is not None:
-                            dcolor = color
-                        else:
-                            dcolor = str(self.deccolors[color])
-                        newsct.write("#define "+color+" "+dcolor+"\n")
-                elif key == "sid":
-                    # Need to insert new diagrams
-                    # Go through the subsections
-                    for sub in self.sidsubs:
-                        # print("Writing: "+sub)
-                        # print(self.subsecs["sid"][sub])
+        # Sections we didn't hold onto are copied over from the master file
+        # Written under a temp name then swapped in, so a failed write leaves the old file alone
+        # With no modver the new file is the master, which has to stay whole until we're done copying it
+        tmpfile = newfile.with_name(newfile.name+".tmp")
+        try:
+            with open(self.index.path, 'rb') as src, open(tmpfile, "w", encoding=self.index.encoding) as newsct:
+                self.writesections(src, newsct)
+        except BaseException:
+            tmpfile.unlink(missing_ok=True)
+            raise
+        os.replace(tmpfile, newfile)
+
+    def writesections(self, src, newsct):
+        # Write each section to newsct, src is the master file opened as binary
+        for key in self.stdsections:
+            # Handle special cases first
+            if key == "colors":
+                # print("Writing: "+key)
+                # Write existing colors
+                # newsct.write(contents)
+                # Write new colors
+                # for name,deccolor in deccolors.items():
+                #    newsct.write("#define "+name+" "+str(deccolor)+"\n")
+                for color, cid in self.usedcolors.items():
+                    newsct.write("#define "+color+" "+self.colors.decs[cid]+"\n")
+            elif key == "sid":
+                # Need to insert new diagrams
+                # Go through the subsections
+                for sub in self.sidsubs:
+                    # print("Writing: "+sub)
+                    if sub in self.subsecs["sid"]:
                         for line in self.subsecs["sid"][sub]:
                             newsct.write(line+"\n")
-                else:  # Business as usual
-                    # print("Writing: "+key)
-                    # print(contents)
-                    for line in contents:
-                        # print(line)
-                        newsct.write(line+"\n")
-                newsct.write("\n\n")
-
-
-def ddtodms(lat, lon):
-    # Convert decimal degrees to the sct2 format of [NSEW]DDD.MM.SS.SSS
-    # First get the NSEW directions
-    latdir = "N" if lat > 0 else "S"
-    londir = "E" if lon > 0 else "W"
-    # Take out any negatives
-    lat = abs(lat)
-    lon = abs(lon)
-    # Round down to integers
-    latdeg = int(lat)
-    londeg = int(lon)
-    # Get minutes
-    latdmin = (lat-latdeg)*60
-    londmin = (lon-londeg)*60
-    # Get seconds
-    latdsec = (latdmin - int(latdmin))*60
-    londsec = (londmin - int(londmin))*60
-    # Assemble the strings
-    latstr = "%s%03.f.%02.f.%06.3f" % (latdir, latdeg, int(latdmin), latdsec)
-    lonstr = "%s%03.f.%02.f.%06.3f" % (londir, londeg, int(londmin), londsec)
-    # Return the lat lon pair in VRC format
-    coordstr = latstr + " " + lonstr
-    return coordstr
-
-
-def dmstodd(clist):
-    # ["N000.00.00.000","E000.00.00.000"]
-    # Get the letters
-    latletter = clist[0][:1]
-    lonletter = clist[1][:1]
-    # Start with positive/negative based on letters
-    declat = 1 if latletter == "N" else -1
-    declon = 1 if lonletter == "E" else -1
-    # print(clist)
-    # Split by decimals, exclude leading letters
-    latelems = clist[0][1:].split('.')
-    lonelems = clist[1][1:].split('.')
-    # print(latelems)
-    # print(lonelems)
-    # Calculate decimal degrees
-    # Multiply by itself which was set above as positive/negative by letter
-    # print(latelems)
-    # print(lonelems)
-    declat *= int(latelems[0])+int(latelems[1])/60+float(latelems[2]+"."+latelems[3])/3600
-    declon *= int(lonelems[0])+int(lonelems[1])/60+float(lonelems[2]+"."+lonelems[3])/3600
-    return (declat, declon)
-
-
-def cosinedist(coord1, coord2):  # Use cosine to find distance between coordinates
-    # Split into lat/lon
-    lat1, lon1 = coord1
-    lat2, lon2 = coord2
-    # Convert latitudes to radians, get difference
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dellamb = math.radians(lon2-lon1)
-    R = 3440.06479  # Nmi
-    # gives d in Nmi
-    d = math.acos(math.sin(phi1)*math.sin(phi2) + math.cos(phi1)*math.cos(phi2) * math.cos(dellamb)) * R
-    return d
-
-
-def coordbrng(coord1, coord2):  # Find heading between coordinates
-    phi1 = math.radians(coord1[0])
-    phi2 = math.radians(coord2[0])
-    lamb1 = math.radians(coord1[1])
-    lamb2 = math.radians(coord2[1])
-    y = math.sin(lamb2-lamb1) * math.cos(phi2)
-    x = math.cos(phi1)*math.sin(phi2) - math.sin(phi1)*math.cos(phi2)*math.cos(lamb2-lamb1)
-    brng = math.degrees(math.atan2(y, x))
-    if brng < 0:
-        brng += 360
-    return brng
-
-
-def coordbrgdist(coord, brng, dist):
-    angdist = dist / 3440.06479
-    phi = math.radians(coord[0])
-    # lamb = math.radians(coord[1])
-    # brng = coordbrng(coord1, coord2)
-    lat = math.degrees(math.asin(math.sin(phi) * math.cos(angdist) + math.cos(phi) * math.sin(angdist) * math.cos(brng)))
-    lon = coord[1] + math.degrees(math.atan2(math.sin(brng) * math.sin(angdist) * math.cos(phi), math.cos(angdist) - math.sin(phi) * math.sin(math.radians(lat))))
-    return (lat, lon)
+                    else:
+                        self.index.copyspan(src, newsct, self.index.subspans["sid"][sub])
+            elif key in self.sections:
+                contents = self.sections[key]
+                if key == "info":
+                    contents[1] = contents[1]+self.modver
+                # print("Writing: "+key)
+                # print(contents)
+                for line in contents:
+                    # print(line)
+                    newsct.write(line+"\n")
+            else:  # Business as usual
+                for span in self.index.spans[key]:
+                    self.index.copyspan(src, newsct, span)
+            newsct.write("\n\n")
+
+
+def airportcoords(lines):
+    # Build the airport coordinates dictionary from AIRPORT section lines
+    names = []
+    tokens = []
+    for line in lines:
+        # WY67 000.000 N041.47.21.809 W110.32.30.609
+        # Split by spaces, remove blanks/newline
+        elems = [i for i in line.split(' ') if i]
+        # length 0 for empty line, 1 for the header
+        # Could test only for >3 but would like to investigate if it's in between
+        if len(elems) > 1:
+            names.append(elems[0])
+            tokens.extend(elems[2:4] if len(elems) > 3 else ["", ""])
+    # Convert to decimal degrees
+    decimal, bad = dmstoddbatch(tokens)
+    for i in sorted(set(i//2 for i in bad)):
+        print("Bad airport coordinates for "+names[i]+": "+" ".join(tokens[2*i:2*i+2]))
+    # Add airport and coords to dict
+    coords = {}
+    for i, name in enumerate(names):
+        lat = decimal[2*i]
+        lon = decimal[2*i+1]
+        if lat == lat and lon == lon:
+            coords[name] = (lat, lon)
+    return coords
+
+
+def segmentlines(dms, color):
+    # Join up a run of DMS coordinates into sct2 lines
+    # Each line starts with end point of previous line
+    end = " "+color
+    return [" "+last+" "+this+end for last, this in zip(dms, dms[1:])]
+
+
+def packcoords(coords):
+    # Get coordinates as a packed lat/lon array
+    # Works on coordseq views, packed arrays, or lists of (lat, lon)
+    if isinstance(coords, array):
+        return coords
+    if hasattr(coords, "flat"):
+        return coords.flat()
+    return array('d', itertools.chain.from_iterable(coords))
+
+
+def rotateoffset(origin, coords, angle):
+    # Turn a list of coords around origin by angle degrees, counterclockwise
+    # Distance from origin is kept, bearing is corrected by the angle
+    # Returns packed lat/lon
+    dists = geodesy.distance(origin, coords)
+    for i, coord in enumerate(coords):
+        if coord == origin:
+            dists[i] = 0
+    brgs = [math.radians(brg - angle) for brg in geodesy.bearing(origin, coords)]
+    return geodesy.destination(origin, brgs, dists)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# Grid index of points for "what's within R nmi of here" questions
+# Points are bucketed into lat/lon cells at least R nmi across, so a query
+# only has to look at the 3x3 block of cells around it
+# Candidates are checked against a bounding box before the exact distance
+
+import math
+import geodesy
+
+
+class pointgrid:
+    # Stretch the boxes a little, degrees to nmi isn't exact on a sphere
+    slack = 1.01
+
+    def __init__(self, points, radius):
+        # points: dict of key -> (lat, lon), or a list of (key, (lat, lon))
+        # radius: largest distance in nmi that will be asked about
+        if isinstance(points, dict):
+            points = points.items()
+        self.points = list(points)
+        self.radius = radius
+        # Degrees of latitude covering the radius (1 nmi is 1 minute)
+        self.latcell = self.slack*radius/60
+        # Degrees of longitude covering the radius, just past the point furthest from the equator
+        maxlat = max([abs(coords[0]) for key, coords in self.points], default=0)
+        self.loncell = self.londegrees(maxlat+self.latcell, radius)
+        self.cells = {}
+        for i, (key, coords) in enumerate(self.points):
+            self.cells.setdefault(self.cell(coords), []).append(i)
+
+    def londegrees(self, lat, radius):
+        # Degrees of longitude covering radius nmi at this latitude
+        coslat = math.cos(math.radians(min(abs(lat), 90)))
+        if coslat*360 <= self.slack*radius/60:
+            # Close enough to the pole that any longitude could be in range
+            return 360
+        return self.slack*radius/(60*coslat)
+
+    def cell(self, coords):
+        # Which cell a point is in
+        # NaN or infinite coordinates aren't anywhere, don't let them pass as some cell
+        if not (math.isfinite(coords[0]) and math.isfinite(coords[1])):
+            raise ValueError("Can't place %r in the grid" % (coords,))
+        return (int(math.floor(coords[0]/self.latcell)), int(math.floor(coords[1]/self.loncell)))
+
+    def candidates(self, coords, radius):
+        # Points in the cells around coords that are inside the bounding box
+        if radius > self.radius:
+            raise ValueError("Grid was built for %.2f nmi, asked for %.2f" % (self.radius, radius))
+        lat, lon = coords
+        dlat = self.slack*radius/60
+        dlon = self.londegrees(abs(lat)+dlat, radius)
+        row, col = self.cell(coords)
+        for r in (row-1, row, row+1):
+            for c in (col-1, col, col+1):
+                for i in self.cells.get((r, c), ()):
+                    key, pcoords = self.points[i]
+                    if abs(pcoords[0]-lat) <= dlat and abs(pcoords[1]-lon) <= dlon:
+                        yield key, pcoords
+
+    def distances(self, coords, radius):
+        # Keys of the candidates and their distances from coords
+        cands = list(self.candidates(coords, radius))
+        if not cands:
+            return [], []
+        return [key for key, pcoords in cands], geodesy.distance([pcoords for key, pcoords in cands], coords)
+
+    def within(self, coords, radius=None):
+        # Keys of all points less than radius nmi from coords
+        radius = self.radius if radius is None else radius
+        keys, dists = self.distances(coords, radius)
+        return [key for key, dist in zip(keys, dists) if dist < radius]
+
+    def anywithin(self, coords, radius=None):
+        # Whether any point is less than radius nmi from coords
+        radius = self.radius if radius is None else radius
+        keys, dists = self.distances(coords, radius)
+        return any(dist < radius for dist in dists)
+
+    def nearest(self, coords, radius=None):
+        # Key of the closest point less than radius nmi from coords, or None
+        radius = self.radius if radius is None else radius
+        best = None
+        bestdist = radius
+        for key, dist in zip(*self.distances(coords, radius)):
+            if dist < bestdist:
+                best = key
+                bestdist = dist
+        return best
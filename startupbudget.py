@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# Checks the command line tools start up quickly
+# Each tool is run with --help a few times and the best time is compared
+# against a bare python start, so only our own startup is counted
+# Also checks modules that are only needed for some jobs aren't imported up front
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Tools to time, in this directory
+scripts = ["apd2kml.py", "apt2kml.py", "kmztosct2.py"]
+
+# Modules that should wait until a job actually needs them
+deferred = ["xml.etree.ElementTree", "zipfile", "pickle", "tempfile", "multiprocessing", "freetype"]
+
+
+def besttime(cmd, runs):
+    # Fastest of a few runs in ms, the slower ones are noise from the machine
+    best = None
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        elapsed = (time.perf_counter()-start)*1000
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def importedmodules(cmd):
+    # Names of every module imported while running cmd
+    result = subprocess.run([cmd[0], "-X", "importtime"]+cmd[1:], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True, check=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and line.count("|") == 2:
+            modules.add(line.split("|")[2].strip())
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the tools' --help startup time against a budget")
+    parser.add_argument("--budget", type=float, default=50,
+                        help="most each tool can take over a bare python start, in ms (default: %(default)s)")
+    parser.add_argument("--runs", type=int, default=7, help="times to run each tool (default: %(default)s)")
+    args = parser.parse_args()
+
+    here = Path(__file__).resolve().parent
+    if sys.flags.dont_write_bytecode:
+        print("Bytecode isn't being cached (PYTHONDONTWRITEBYTECODE), times include compiling every module")
+    base = besttime([sys.executable, "-c", "pass"], args.runs)
+    print("python: %.1f ms" % base)
+    failed = 0
+    for script in scripts:
+        cmd = [sys.executable, str(here / script), "--help"]
+        overhead = besttime(cmd, args.runs)-base
+        early = sorted(set(deferred) & importedmodules(cmd))
+        over = overhead > args.budget
+        print("%s: %.1f ms%s" % (script, overhead, " OVER BUDGET" if over else ""))
+        if early:
+            print("  imported too early: "+", ".join(early))
+        if over or early:
+            failed += 1
+    if failed:
+        print("%i of %i over budget (%.0f ms)" % (failed, len(scripts), args.budget))
+        sys.exit(1)
+    print("All within budget (%.0f ms)" % args.budget)
+
+
+if __name__ == "__main__":
+    main()
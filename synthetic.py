@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+
+# Made up inputs for benchmarking and trying things out
+# Sector files, diagram kmzs and TowerTrainer .apt files that look enough like
+# the real ones to go through the same code, at whatever size is asked for
+# The same seed always gives the same files
+
+import argparse
+import random
+from pathlib import Path
+import kmlwriter
+import sectorfile
+import vrccolors
+
+# Master file apd2kml reads, kmztosct2 builds it as its ZSE sector file
+sectorname = "ZSE-v3_05"
+airac = "1903"
+
+# Colors used for the new diagrams
+linecolors = ["taxiway", "runway", "apron", "holdshort", "building", "taxilane"]
+labelcolors = ["ramp_labels", "building_labels", "taxilane_labels"]
+# Labels in this color are also drawn as lines, see sectorfileobj.renderdiagram
+strokedcolor = "twyrwy_labels"
+# Colors only the old sector file lines use, one is a plain decimal color
+oldcolors = ["taxiOld", "Gray", "8421376"]
+
+# Category folders in the kmz, each becomes a SID subsection
+categories = ["Current Diagrams", "Old Diagram Ref"]
+
+# Airports are spread out on a grid far enough apart that they don't share lines
+gridstart = (43.0, -124.5)
+gridstep = 0.25
+gridcols = 32
+# How far lines and labels spread around an airport, in degrees
+spread = 0.03
+# How far each step of a line goes, in degrees
+step = 0.0015
+
+# Width the SID subsection names are padded to
+subwidth = 27
+zerocoords = "N000.00.00.000 E000.00.00.000 N000.00.00.000 E000.00.00.000"
+
+
+def airports(count):
+    # ICAO and location of each airport, the ones sector files know about first
+    # Made up names after that are only in the ZSE file, see register()
+    names = list(sectorfile.sectorfileobj.aptsectors)[:count]
+    names.extend("X%03i" % i for i in range(count-len(names)))
+    return [(name, (gridstart[0]+gridstep*(i // gridcols), gridstart[1]+gridstep*(i % gridcols)))
+            for i, name in enumerate(names)]
+
+
+def register(apts):
+    # Let the ZSE file take diagrams for the made up airports too
+    known = sectorfile.sectorfileobj.aptsectors
+    extra = {name: "" for name, loc in apts if name not in known}
+    if extra:
+        sectorfile.sectorfileobj.aptsectors = dict(known, **extra)
+
+
+def near(rng, loc, dist=spread):
+    return (loc[0]+rng.uniform(-dist, dist), loc[1]+rng.uniform(-dist, dist))
+
+
+def walk(rng, start, count):
+    # Line wandering away from start, count points long
+    points = [start]
+    for i in range(count-1):
+        points.append(near(rng, points[-1], step))
+    return points
+
+
+def subheader(name):
+    return name.ljust(subwidth)+zerocoords
+
+
+def writesct2(path, apts, seed=0, sidlines=200, labels=50, geo=5000):
+    # Sector file with old diagrams for each airport
+    # sidlines segments and labels labels around each airport, geo lines spread over the whole area
+    rng = random.Random(seed)
+    colors = vrccolors.getregistry()
+    with open(path, 'w') as out:
+        out.write("; Synthetic sector file\n\n")
+        for color in linecolors+labelcolors+oldcolors:
+            if not vrccolors.isdeccolor(color):
+                out.write("#define %s %s\n" % (color, colors.dec(color.lower())))
+        out.write("\n[INFO]\nSynthetic\nZSE_CTR\nKSEA\nN047.26.58.100\nW122.18.33.400\n60\n40\n-16.5\n1\n\n")
+        out.write("[VOR]\nSEA 116.800 N047.26.07.000 W122.18.34.000\n\n[NDB]\n\n[AIRPORT]\n")
+        for name, loc in apts:
+            out.write("%s 000.000 %s C\n" % (name, sectorfile.ddtodms(*loc)))
+        out.write("\n[RUNWAY]\n\n[FIXES]\n\n[ARTCC]\n\n[ARTCC HIGH]\n\n[ARTCC LOW]\n\n")
+        out.write("[SID]\n"+subheader("========SIDs=========")+"\n"+subheader("(Airports)")+"\n")
+        for name, loc in apts:
+            out.write(";"+name+"\n")
+            done = 0
+            while done < sidlines:
+                # Chains of segments, each starting where the last ended
+                color = rng.choice(linecolors+oldcolors)
+                points = walk(rng, near(rng, loc), min(rng.randint(2, 12), sidlines-done+1))
+                for start, end in zip(points, points[1:]):
+                    out.write(" "+sectorfile.ddtodms(*start)+" "+sectorfile.ddtodms(*end)+" "+color+"\n")
+                done += len(points)-1
+        for cat in categories:
+            # Old content for the subsections the new diagrams replace
+            out.write(subheader("("+cat+")")+"\n")
+            start, end = walk(rng, apts[0][1], 2)
+            out.write(" "+sectorfile.ddtodms(*start)+" "+sectorfile.ddtodms(*end)+" taxiway\n")
+        out.write(subheader("======AIRSPACE=======")+"\n")
+        out.write("\n[STAR]\n"+subheader("========SUAs=========")+"\n\n[LOW AIRWAY]\n\n[HIGH AIRWAY]\n\n[GEO]\n")
+        lats = (gridstart[0], gridstart[0]+gridstep*(1+(len(apts)-1) // gridcols))
+        lons = (gridstart[1], gridstart[1]+gridstep*min(len(apts), gridcols))
+        for i in range(geo):
+            start = (rng.uniform(*lats), rng.uniform(*lons))
+            end = near(rng, start, 0.01)
+            out.write(sectorfile.ddtodms(*start)+" "+sectorfile.ddtodms(*end)+" "+rng.choice(oldcolors)+"\n")
+        out.write("\n[REGIONS]\n")
+        for name, loc in apts[:10]:
+            out.write("apron "+sectorfile.ddtodms(*near(rng, loc))+"\n")
+            for i in range(3):
+                out.write(" "+sectorfile.ddtodms(*near(rng, loc))+"\n")
+        out.write("\n[LABELS]\n")
+        for name, loc in apts:
+            # Most labels are close enough to be replaced, some are left alone
+            for i in range(labels):
+                where = near(rng, loc) if i % 5 else near(rng, loc, 0.1)
+                out.write('"%s %i" %s %s\n' % (name, i, sectorfile.ddtodms(*where), rng.choice(labelcolors)))
+
+
+def placemarks(rng, loc, count, stroked=0):
+    # Placemarks for one airport as category -> color -> list of (kind, name, points, desc)
+    # stroked more are labels that get drawn as lines, which needs a font
+    cats = {}
+    for i in range(count):
+        cat = categories[0] if rng.random() < 0.8 else categories[1]
+        kind = rng.random()
+        start = near(rng, loc)
+        if kind < 0.15:
+            pmark = ("point", "L%i" % i, [start], "")
+            color = rng.choice(labelcolors)
+        else:
+            color = rng.choice(linecolors)
+            if kind < 0.2:
+                pmark = ("line", "dashed", walk(rng, start, 2), "")
+            elif kind < 0.23:
+                pmark = ("line", "circle", walk(rng, start, 2), "")
+            elif kind < 0.25:
+                pmark = ("line", "arc_%i_%i" % (rng.randrange(360), rng.randrange(360)), walk(rng, start, 2), "")
+            elif kind < 0.4:
+                ring = walk(rng, start, rng.randint(3, 30))
+                pmark = ("polygon", "Polygon", ring+ring[:1], "")
+            else:
+                pmark = ("line", "Line", walk(rng, start, rng.randint(2, 60)), "")
+        cats.setdefault(cat, {}).setdefault(color, []).append(pmark)
+    for i in range(stroked):
+        # Taxiway/runway labels, plot=True labels, and plot=True lines
+        # Lines are drawn from the first point along to the second, that far tall
+        text = rng.choice("ABCDEFGHJKMNPRTW")+str(rng.randint(1, 12))
+        start = near(rng, loc)
+        kind = i % 3
+        if kind == 0:
+            color = strokedcolor
+            pmark = ("point", text, [start], "")
+        elif kind == 1:
+            color = rng.choice(labelcolors)
+            pmark = ("point", text, [start], "plot=True")
+        else:
+            color = rng.choice(linecolors)
+            pmark = ("line", text, [start, near(rng, start, 0.0002)], "plot=True")
+        cats.setdefault(categories[0], {}).setdefault(color, []).append(pmark)
+    return cats
+
+
+def writekmz(path, apts, seed=0, count=100, stroked=0):
+    # Diagram kmz with count placemarks for each airport, laid out the way readkmz expects
+    # Plus stroked labels for each airport, drawn as lines
+    rng = random.Random(seed)
+    diagrams = [(name, placemarks(rng, loc, count, stroked)) for name, loc in apts]
+    with kmlwriter.opendoc(path) as out:
+        kml = kmlwriter.kmlwriter(out)
+        kml.startdoc("diagrams.kml")
+        kml.startfolder("ZSE Airport Diagrams", 1)
+        for cat in categories:
+            kml.startfolder(cat)
+            for name, cats in diagrams:
+                kml.startfolder(name)
+                for color, pmarks in cats.get(cat, {}).items():
+                    kml.startfolder(color)
+                    for kind, pmname, points, desc in pmarks:
+                        if kind == "point" and not desc:
+                            kml.point(points[0], pmname, color)
+                            continue
+                        kml.start("Placemark")
+                        kml.leaf("name", pmname)
+                        if desc:
+                            kml.leaf("description", desc)
+                        coords = " ".join("%r,%r,0" % (lon, lat) for lat, lon in points)
+                        if kind == "point":
+                            kml.start("Point")
+                            kml.leaf("coordinates", coords)
+                        elif kind == "polygon":
+                            kml.start("Polygon")
+                            kml.start("outerBoundaryIs")
+                            kml.start("LinearRing")
+                            kml.leaf("coordinates", coords)
+                            kml.end()
+                            kml.end()
+                        else:
+                            kml.start("LineString")
+                            kml.leaf("coordinates", coords)
+                        kml.end()
+                        kml.end()
+                    kml.end()
+                kml.end()
+            kml.end()
+        kml.enddoc()
+
+
+def writeapt(path, name, loc, seed=0, count=20):
+    # TowerTrainer .apt file with count of each kind of item
+    rng = random.Random(seed)
+    with open(path, 'w') as out:
+        out.write("icao=%s\nname=Synthetic %s\n\n" % (name, name))
+        for kind in ("PARKING", "HOLD"):
+            for i in range(count):
+                out.write("[%s %s%i]\n%r %r\n\n" % ((kind, kind[0], i)+near(rng, loc)))
+        for i in range(count):
+            out.write("[TAXIWAY T%i]\n" % i)
+            for lat, lon in walk(rng, near(rng, loc), rng.randint(2, 30)):
+                out.write("%r %r\n" % (lat, lon))
+            out.write("\n")
+        for i in range(max(1, count // 10)):
+            out.write("[RUNWAY %i]\nwidth=150\n" % (i+1))
+            for lat, lon in walk(rng, near(rng, loc), 2):
+                out.write("%r %r\n" % (lat, lon))
+            out.write("\n")
+
+
+def writeset(directory, count=29, placemarkcount=100, sidlines=200, labels=50, geo=5000, seed=0, stroked=0):
+    # Everything the tools need, in directory
+    # Returns the airports and the paths of the sector file, kmz and .apt files
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    apts = airports(count)
+    sct2 = directory / (sectorname+"_"+airac+".sct2")
+    writesct2(sct2, apts, seed, sidlines, labels, geo)
+    kmz = directory / "diagrams.kmz"
+    writekmz(kmz, apts, seed, placemarkcount, stroked)
+    aptdir = directory / "apt"
+    aptdir.mkdir(exist_ok=True)
+    aptfiles = []
+    for i, (name, loc) in enumerate(apts[:10]):
+        aptfiles.append(aptdir / (name+".apt"))
+        writeapt(aptfiles[-1], name, loc, seed+i, max(1, placemarkcount // 5))
+    return apts, sct2, kmz, aptfiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a made up sector file, diagram kmz and .apt files")
+    parser.add_argument("directory", help="where to put the files")
+    parser.add_argument("--airports", type=int, default=29, help="number of airports (default: %(default)s)")
+    parser.add_argument("--placemarks", type=int, default=100, help="kmz placemarks per airport (default: %(default)s)")
+    parser.add_argument("--sid-lines", type=int, default=200, help="old SID segments per airport (default: %(default)s)")
+    parser.add_argument("--labels", type=int, default=50, help="old labels per airport (default: %(default)s)")
+    parser.add_argument("--geo", type=int, default=5000, help="GEO lines (default: %(default)s)")
+    parser.add_argument("--stroked", type=int, default=0,
+                        help="labels per airport drawn as lines, building needs a font for these (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.airports < 1:
+        parser.error("--airports has to be at least 1")
+    writeset(args.directory, args.airports, args.placemarks, args.sid_lines, args.labels, args.geo, args.seed, args.stroked)
+
+
+if __name__ == "__main__":
+    main()
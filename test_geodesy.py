@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Checks the batch functions in geodesy against the single point versions
+
+import math
+import random
+import pytest
+import geodesy
+
+# Batch results have to be this close to the single point ones, nmi or degrees
+tolerance = 1e-9
+
+rng = random.Random(19)
+origins = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for i in range(20)]
+targets = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for i in range(20)]
+brngs = [rng.uniform(0, 2*math.pi) for i in range(20)]
+dists = [rng.uniform(0.01, 500) for i in range(20)]
+
+
+def close(batch, single):
+    assert len(batch) == len(single)
+    for got, want in zip(batch, single):
+        assert math.isclose(got, want, rel_tol=0, abs_tol=tolerance)
+
+
+def test_one_to_many():
+    origin = origins[0]
+    close(geodesy.distance(origin, targets), [geodesy.cosinedist(origin, t) for t in targets])
+    close(geodesy.bearing(origin, targets), [geodesy.coordbrng(origin, t) for t in targets])
+    want = [geodesy.coordbrgdist(origin, b, d) for b, d in zip(brngs, dists)]
+    close(geodesy.destination(origin, brngs, dists), [x for point in want for x in point])
+
+
+def test_many_to_one():
+    target = targets[0]
+    close(geodesy.distance(origins, target), [geodesy.cosinedist(o, target) for o in origins])
+    close(geodesy.bearing(origins, target), [geodesy.coordbrng(o, target) for o in origins])
+    want = [geodesy.coordbrgdist(o, brngs[0], dists[0]) for o in origins]
+    close(geodesy.destination(origins, brngs[0], dists[0]), [x for point in want for x in point])
+
+
+def test_many_to_many():
+    close(geodesy.distance(origins, targets), [geodesy.cosinedist(o, t) for o, t in zip(origins, targets)])
+    close(geodesy.bearing(origins, targets), [geodesy.coordbrng(o, t) for o, t in zip(origins, targets)])
+    want = [geodesy.coordbrgdist(o, b, d) for o, b, d in zip(origins, brngs, dists)]
+    close(geodesy.destination(origins, brngs, dists), [x for point in want for x in point])
+
+
+def test_packed_input():
+    packed = geodesy.array('d', [x for point in origins for x in point])
+    close(geodesy.distance(packed, targets), geodesy.distance(origins, targets))
+
+
+def test_mismatched_lengths():
+    with pytest.raises(ValueError):
+        geodesy.distance(origins, targets[:5])
+    with pytest.raises(ValueError):
+        geodesy.bearing(origins[:3], targets[:4])
+    with pytest.raises(ValueError):
+        geodesy.destination(origins, brngs[:5], dists)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+
+# Checks for parsing kml coordinates
+
+from kmzfile import parsecoords
+
+
+def test_same_fields():
+    assert list(parsecoords(" -122.3,47.4,0 -122.31,47.41,0\n")) == [(47.4, -122.3), (47.41, -122.31)]
+
+
+def test_mixed_fields():
+    assert list(parsecoords("-122.3,47.4 -122.31,47.41,0")) == [(47.4, -122.3), (47.41, -122.31)]
+
+
+def test_empty_fields():
+    # Trailing empty altitude passes the comma count but can't be split into columns
+    assert list(parsecoords("-122.3,47.4, -122.3,47.4,")) == [(47.4, -122.3), (47.4, -122.3)]
+    assert list(parsecoords("-122.3,47.4,,0 -122.31,47.41,,0")) == [(47.4, -122.3), (47.41, -122.31)]
+
+
+def test_empty():
+    assert list(parsecoords("")) == []
+    assert list(parsecoords(None)) == []
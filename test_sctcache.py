@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+# Checks for the on-disk cache of parsed sector files
+
+import zlib
+import pytest
+from sctcache import sctcache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    master = tmp_path / "master.sct2"
+    master.write_text("[INFO]\n")
+    return sctcache(tmp_path / "cache"), master
+
+
+def test_roundtrip(cache):
+    cache, master = cache
+    assert cache.load("sector", master) is None
+    cache.store("sector", master, {"magvar": -16.5})
+    assert cache.load("sector", master) == {"magvar": -16.5}
+
+
+@pytest.mark.parametrize("data", [b"not zlib",
+                                  zlib.compress(b"not a pickle"),
+                                  # Classes that have been renamed or moved since the entry was written
+                                  zlib.compress(b"cnosuchmodule\nthing\n."),
+                                  zlib.compress(b"csctcache\nnosuchclass\n.")],
+                         ids=["zlib", "pickle", "module", "class"])
+def test_bad_entry(cache, data):
+    cache, master = cache
+    cache.store("sector", master, None)
+    entry = cache.entrypath("sector", master)
+    entry.write_bytes(data)
+    assert cache.load("sector", master) is None
+    assert not entry.exists()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# Checks for pruning old labels around airports with new diagrams
+
+import sectorfile
+import synthetic
+
+
+def makesector(tmp_path, old=None, new=None):
+    # Small made up sector file, with the first old swapped for new
+    apts = synthetic.airports(3)
+    path = tmp_path / (synthetic.sectorname+"_"+synthetic.airac+".sct2")
+    synthetic.writesct2(path, apts, sidlines=10, labels=10, geo=10)
+    if old is not None:
+        text = path.read_text()
+        assert old in text
+        path.write_text(text.replace(old, new, 1))
+    return apts, sectorfile.sectorfileobj(synthetic.sectorname, tmp_path, synthetic.airac, "b")
+
+
+def labelsfor(sectorobj, name):
+    return [line for line in sectorobj.sections["labels"] if line.startswith('"'+name+' ')]
+
+
+def farfrom(lines, loc):
+    # Labels that shouldn't be pruned for an airport at loc
+    return [line for line in lines
+            if sectorfile.cosinedist(loc, sectorfile.dmstodd(line.split(" ")[2:4])) >= 3]
+
+
+def test_prune(tmp_path):
+    apts, sectorobj = makesector(tmp_path)
+    name, loc = apts[0]
+    old = labelsfor(sectorobj, name)
+    others = labelsfor(sectorobj, apts[1][0])
+    sectorobj.prunelabels([name])
+    assert labelsfor(sectorobj, name) == farfrom(old, loc)
+    assert labelsfor(sectorobj, apts[1][0]) == others
+
+
+def test_bad_airport(tmp_path, capsys):
+    # An airport with new labels but no usable coordinates keeps its old labels
+    name, loc = synthetic.airports(1)[0]
+    old = name+" 000.000 "+sectorfile.ddtodms(*loc)
+    apts, sectorobj = makesector(tmp_path, old, name+" 000.000 N04X.00.00.000 W122.00.00.000")
+    assert name not in sectorobj.airportcoords
+    other, otherloc = apts[1]
+    otherold = labelsfor(sectorobj, other)
+    sectorobj.prunelabels([name, other])
+    assert "No coordinates for airport "+name in capsys.readouterr().out
+    assert len(labelsfor(sectorobj, name)) == 10
+    assert labelsfor(sectorobj, other) == farfrom(otherold, otherloc)
+
+
+def test_bad_label(tmp_path, capsys):
+    # A label that can't be read is kept, whatever is near it
+    name, loc = synthetic.airports(1)[0]
+    label = '"%s 0" ' % name
+    apts, sectorobj = makesector(tmp_path, label, '"broken" N047.26.5X.100 W122.18.33.400 ramp_labels\n'+label)
+    old = labelsfor(sectorobj, name)
+    sectorobj.prunelabels([name])
+    assert "Bad label coordinates, keeping it: N047.26.5X.100" in capsys.readouterr().out
+    assert sectorobj.sections["labels"].count('"broken" N047.26.5X.100 W122.18.33.400 ramp_labels') == 1
+    assert labelsfor(sectorobj, name) == farfrom(old, loc)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+# Checks for the grid index of points
+
+import math
+import pytest
+import geodesy
+from spatialindex import pointgrid
+
+points = {"KSEA": (47.449, -122.309), "KBFI": (47.530, -122.302), "KPAE": (47.906, -122.282)}
+
+
+def test_within():
+    grid = pointgrid(points, 10)
+    here = (47.5, -122.3)
+    want = [key for key, coords in points.items() if geodesy.cosinedist(here, coords) < 10]
+    assert sorted(grid.within(here)) == sorted(want)
+    assert grid.anywithin(here)
+    assert grid.nearest(here) == "KBFI"
+    assert not grid.anywithin((45.0, -120.0))
+
+
+def test_nonfinite():
+    grid = pointgrid(points, 3)
+    for coords in [(math.nan, -122.3), (47.4, math.nan), (math.inf, -122.3)]:
+        with pytest.raises(ValueError):
+            grid.anywithin(coords)
+        with pytest.raises(ValueError):
+            pointgrid([("bad", coords)], 3)
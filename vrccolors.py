@@ -141,30 +141,29 @@ defaultcolors = {
 }
 
 
+def hextodec(hexcolor, derate=1):
+    # HTML color to the VRC decimal format
+    # Multiply colors by derate to increase/decrease brightness
+    # Get rid of the leading #
+    straighthex = hexcolor.replace("#", '')
+    # Split hex into R G B with 0x for conversion
+    hexrgb = ["0x"+straighthex[i:i+2] for i in range(0, len(straighthex), 2)]
+    # Convert each to int
+    decred = int(int(hexrgb[0], 0)*derate)
+    decgrn = int(int(hexrgb[1], 0)*derate)
+    decblu = int(int(hexrgb[2], 0)*derate)
+    # Cap at 255 in increasing brightness
+    decred = decred if decred < 256 else 255
+    decgrn = decgrn if decgrn < 256 else 255
+    decblu = decblu if decblu < 256 else 255
+    # Create the VRC color notation
+    return decred + decgrn*256 + decblu*65536
+
+
 def getcolors(hexcolors=defaultcolors):
     # Create new dict for decimal colors
-    deccolors = {}
-    # Multiply colors by this to increase/decrease brightness
-    derate = 1
-    # Convert all the hex colors to the VRC format
-    for name, hexcolor in hexcolors.items():
-        # Get rid of the leading #
-        straighthex = hexcolor.replace("#", '')
-        # Split hex into R G B with 0x for conversion
-        hexrgb = ["0x"+straighthex[i:i+2] for i in range(0, len(straighthex), 2)]
-        # Convert each to int
-        decred = int(int(hexrgb[0], 0)*derate)
-        decgrn = int(int(hexrgb[1], 0)*derate)
-        decblu = int(int(hexrgb[2], 0)*derate)
-        # Cap at 255 in increasing brightness
-        decred = decred if decred < 256 else 255
-        decgrn = decgrn if decgrn < 256 else 255
-        decblu = decblu if decblu < 256 else 255
-        # Create the VRC color notation
-        deccolor = decred + decgrn*256 + decblu*65536
-        # Store names in lower case for key searches
-        deccolors[name.lower()] = deccolor
-    return deccolors
+    # Store names in lower case for key searches
+    return {name.lower(): hextodec(hexcolor) for name, hexcolor in hexcolors.items()}
 
 #print(colordefs)
 
@@ -174,3 +173,86 @@ def deccolortohtml(deccolor):
     decred = deccolor-decblu*65536-decgrn*256
     # print('"%s": "#%02x%02x%02x",' % (name, decred, decgrn, decblu))
     return "#%02x%02x%02x" % (decred, decgrn, decblu)
+
+
+def htmltokml(htmlcolor):
+    # KML has the color pairs the other way round, BBGGRR
+    # The alpha in front is left to the kml writer
+    color = htmlcolor.replace('#', '')
+    colorsplit = [color[i:i+2] for i in range(0, len(color), 2)]
+    colorsplit.reverse()
+    return ''.join(colorsplit)
+
+
+def isdeccolor(color):
+    # Plain VRC decimal color, up to 8 digits
+    return len(color) <= 8 and color.isdecimal()
+
+
+class colorregistry:
+    # Every color name and VRC decimal color seen, each given a small id
+    # Names are kept in lower case, decimal colors as they were written
+    # The #define value, html and kml forms are worked out once when a color
+    # is added, so after that checking or converting one is a dict lookup
+
+    def __init__(self, hexcolors=defaultcolors):
+        # Color -> id
+        self.ids = {}
+        # Each form by id
+        self.names = []
+        self.decs = []
+        self.htmls = []
+        self.kmls = []
+        for name, hexcolor in hexcolors.items():
+            self.add(name.lower(), str(hextodec(hexcolor)), hexcolor)
+        # Ids below this are named colors, decimal ones are added after
+        self.namedcount = len(self.names)
+
+    def add(self, color, dec, html):
+        # Intern a color, a name seen again takes the newer values
+        cid = self.ids.get(color)
+        if cid is None:
+            cid = self.ids[color] = len(self.names)
+            self.names.append(color)
+            self.decs.append(None)
+            self.htmls.append(None)
+            self.kmls.append(None)
+        self.decs[cid] = dec
+        self.htmls[cid] = html
+        self.kmls[cid] = htmltokml(html)
+        return cid
+
+    def id(self, color):
+        # Id of a named or decimal color, None if it's neither
+        cid = self.ids.get(color)
+        if cid is None and isdeccolor(color):
+            cid = self.add(color, color, deccolortohtml(int(color)))
+        return cid
+
+    def isnamed(self, color):
+        # Whether this is one of the named colors
+        cid = self.ids.get(color)
+        return cid is not None and cid < self.namedcount
+
+    def dec(self, color):
+        # Value for the #define line
+        return self.decs[self.ids[color]]
+
+    def kml(self, color):
+        # KML color (BBGGRR), None if the color isn't known
+        cid = self.id(color)
+        if cid is None:
+            return None
+        return self.kmls[cid]
+
+
+# Colors shared by everything in this process
+# Built the first time something asks for a color, not when this is imported
+registry = None
+
+
+def getregistry():
+    global registry
+    if registry is None:
+        registry = colorregistry()
+    return registry